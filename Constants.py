@@ -125,9 +125,11 @@ class MEMORY_DESCRIPTION(Enum):
     END_ADDRESS = "end"
     ALIGNED = "aligned"
     IMEM_DMEM_OVERLAP = "imem-overlap"
+    IMEM_SIZE = "imem-size"  # instructions that fit into the imem, bounds packed test programs
 
 
 DEFAULT_MAX_MEMORY_ADDRESS = 2 ** 12 - 1
+MEMORY_SEARCH_RETRIES = 64  # random draws for a free dmem address before the free addresses are enumerated
 
 
 class FORMAT_DESCRIPTION(Enum):
@@ -155,9 +157,13 @@ SPECIALIZATION = "specialization"
 PROCESSOR = "processor"
 
 MAX_BRANCH_DISTANCE = "max-conditional-branch-distance"
+PSEUDO_INSTRUCTIONS = "pseudo-instructions"  # machine instructions of assembler pseudo instructions
+PSEUDO_INSTRUCTION_SIZE = "size"
+PSEUDO_INSTRUCTION_IMMEDIATE_BITS = "immediate-bits"  # a smaller immediate fits into a single machine instruction
 FIX_IMM_VALUE = "fixed-imm-value"
 SPECIAL_IMMEDIATES = "special-immediates"
 INSTRUCTION_TYPE = "type"
+INSTRUCTION_FEATURES = "instruction-features"
 MULTI_CYCLE_INSTRUCTION_TYPE = "-M"
 NOP_INSTR = "nop"
 NONE_CONSTANT = "None"
@@ -174,6 +180,10 @@ INSTRUCTION_SPECIAL_FEATURE = [SIGNAGE, SIMD, CONDITIONAL, CONDITIONAL_READ, SAT
 CONDITION_ELEMENTS = ["zero", "carry", "overflow", "negative"]
 
 FOLDER_EXPORT_ASSEMBLY = "reversiAssembly"
+# tests are written as files into FOLDER_EXPORT_ASSEMBLY or into one archive per process
+OUTPUT_DIRECTORY = "dir"
+OUTPUT_FORMATS = [OUTPUT_DIRECTORY, "tar", "tar.zst", "zip"]
+OUTPUT_ARCHIVE_PREFIX = "tests"
 
 
 def get_path_processor(architecture):
@@ -212,4 +222,24 @@ CONDITION_PRE_REVERSE = "pre-reverse"
 CONDITION_POST_REVERSE = "post-reverse"
 
 
-TEST_ENABLED = False
\ No newline at end of file
+TEST_ENABLED = False
+
+VERSION = "1.1"
+
+# persistent cache of processed targets (parsed xml and DataBank), see util/TargetCache.py
+FOLDER_TARGET_CACHE = "~/.cache/patara"
+TARGET_CACHE_FORMAT = 3  # increase if the structure of the cached objects changes
+TARGET_CACHE_ENABLED = True
+TARGET_CACHE_DESCRIPTION = "target"
+TARGET_CACHE_DATABANK = "databank"
+
+MNEMONIC_CACHE_SIZE = 4096  # maximum number of rendered mnemonics kept per processor
+
+# bounded memory mode for long interleaving tests: test instructions are kept in a TestInstructionLog and assembly
+# buffers and logs larger than BOUNDED_MEMORY_SPILL_SIZE bytes are moved to temporary files
+BOUNDED_MEMORY = False
+BOUNDED_MEMORY_SPILL_SIZE = 64 * 2 ** 20
+
+# random immediates are drawn IMMEDIATE_POOL_SIZE at a time (with NumPy, if installed) and handed out from a pool
+IMMEDIATE_POOL = False
+IMMEDIATE_POOL_SIZE = 4096
@@ -10,9 +10,13 @@
 
 import argparse
 import multiprocessing
+import multiprocessing.util
 import os
+import re
 import subprocess
 import time
+import warnings
+from collections import Counter
 from os.path import exists, isdir
 
 from Constants import ADDRESS_ALIGNMENT, CONDITIONAL, CONDITIONAL_READ, FOLDER_EXPORT_ASSEMBLY, IMMEDIATE, SATURATION, SIGNAGE, SIMD, SWITCH, get_path_header, get_path_footer
@@ -24,6 +28,13 @@ from util.Processor import Processor
 from util.RandomOptions import RandomOptions
 from util.Stack import Stack
 from util.TestInstruction import TestInstruction
+from util.TestWriter import TestWriter
+
+
+# random options and stack of the process, created once by init_worker
+_worker = None
+# writer of the generated tests of the process, created by init_worker
+_writer = None
 
 
 def existsDirectory(path):
@@ -69,58 +80,149 @@ def print_arguments(args, parser):
             print()  # Blank line between groups
 
 
-def write_files(prefix, singleInstructionTests, runID, loopIteration):
-    fileCount = 0
-    for instructionName, code in singleInstructionTests.items():
+def write_files(prefix, singleInstructionTests, runID, loopIteration, pack=1):
+    """Writes the tests of a basic or complete test into files and returns the number of files. With pack > 1 the
+    tests of pack consecutive indices are written into one file, see write_packed_files."""
+    if pack > 1:
+        return write_packed_files(prefix, singleInstructionTests, runID, loopIteration, pack)
+    for instructionName, (fileCount, code) in singleInstructionTests.items():
         filestring = prefix+"_" + instructionName + "_" + str(loopIteration) +"_" + str(fileCount) +"_"+ runID+ "." + Processor().get_assembler_ending()
-        exportFile = os.path.join(FOLDER_EXPORT_ASSEMBLY, filestring)
+        get_writer().write(filestring, header, code, footer)
+    return len(singleInstructionTests)
+
+
+def write_packed_files(prefix, singleInstructionTests, runID, loopIteration, pack):
+    """Writes the tests with the indices pack * n to pack * (n + 1) - 1 into one program, that is named by its first
+    index. Each test starts with a comment and, if the target has branch labels, the label TEST_index, so a failed
+    comparison can be traced back to its test. A program is split, if it would exceed the imem size of the processor."""
+    processor = Processor()
+    imemSize = processor.getIMemSize()
+    frameInstructions = processor.countAssemblyInstructions(header + footer)
+    comment = processor.get_assembler_comment()
+    label = processor.getBranchTargetLabel()
+
+    programs = []
+    programInstructions = 0
+    lastBlock = None
+    for instructionName, (fileCount, code) in sorted(singleInstructionTests.items(), key=lambda test: test[1][0]):
+        testCode = "\n" + comment + " Test " + str(fileCount) + ": " + instructionName + "\n"
+        if label:
+            testCode += "TEST_" + str(fileCount) + label + "\n"
+        # each test numbers its branch labels from 0, they get the test index as suffix
+        testCode += make_labels_unique(code, "_T" + str(fileCount))
+        testInstructions = processor.countAssemblyInstructions(testCode)
+        if imemSize and frameInstructions + testInstructions > imemSize:
+            warnings.warn(f"Test {instructionName} does not fit into the imem ({imemSize} machine instructions)")
+        if fileCount // pack != lastBlock or (imemSize and programInstructions + testInstructions > imemSize):
+            programs.append((fileCount, []))
+            programInstructions = frameInstructions
+            lastBlock = fileCount // pack
+        programs[-1][1].append(testCode)
+        programInstructions += testInstructions
+
+    for firstIndex, testCodes in programs:
+        filestring = prefix + "_pack_" + str(loopIteration) + "_" + str(firstIndex) + "_" + runID + "." + processor.get_assembler_ending()
+        labelCounts = Counter(processor.getAssemblyLabels(header + "".join(testCodes) + footer))
+        duplicates = [name for name, count in labelCounts.items() if count > 1]
+        if duplicates:
+            raise Exception(f"ERROR: Labels {', '.join(duplicates)} are defined more than once in {filestring}")
+        get_writer().write(filestring, header, *testCodes, footer)
+    return len(programs)
+
+
+def make_labels_unique(code, suffix):
+    """appends suffix to the labels defined in code and to their uses in code"""
+    labels = Processor().getAssemblyLabels(code)
+    if not labels:
+        return code
+    pattern = re.compile(r"\b(" + "|".join(re.escape(name) for name in set(labels)) + r")\b")
+    return pattern.sub(lambda match: match.group(1) + suffix, code)
+
+
+def init_worker(args, runID=""):
+    """Loads the target and creates the stack once per worker process. Worker processes forked from the main process
+    share the target description and test instructions it already loaded. Each process gets its own test writer, its
+    archive is finished when the process exits."""
+    global _worker, _writer
+    _writer = TestWriter(FOLDER_EXPORT_ASSEMBLY, args.output_format, runID)
+    multiprocessing.util.Finalize(_writer, _writer.close, exitpriority=10)
+    random_ops = RandomOptions(args)
+    Processor(architecture=args.architecture, cacheMiss=float(args.dcacheMiss),
+              newMemoryBlock=float(args.newMemoryBlock))
+    stack = Stack(args.architecture, args.icacheMiss, enabled_extensions=args.isa_extensions)
+    ConditionalExecutionCode(args.architecture, DataBank().get_instruction_list())
+    _worker = (random_ops, stack)
 
-        rawfile = open(exportFile, 'w')
-        rawfile.write(header)
-        rawfile.write(code)
-        rawfile.write(footer)
-        rawfile.close()
 
-        fileCount += 1
-    
+def get_worker(args):
+    """returns the random options and the stack of this process, see init_worker"""
+    if _worker is None:
+        init_worker(args)
+    return _worker
+
+
+def get_writer():
+    """returns the test writer of this process, see init_worker"""
+    return _writer
+
+
+def estimate_test_instructions(job):
+    """estimates the number of test instructions of one job, to start long jobs first"""
+    task, runID, loopIteration, args, *taskArgs = job
+    testInstructions = len(DataBank().getTestInstructions())
+    if task is create_basic_instruciton_test or task is create_complete_instruction_test:
+        return testInstructions // max(int(args.threads), 1)
+    if task is createSequence:
+        # one file per type combination of the job
+        combinationCount = taskArgs[1]
+        return combinationCount * int(args.sequenceLength) * (1 + int(args.forwarding))
+    if task is createInterleaving:
+        if args.max_interleaving_instructions > 0:
+            return min(args.max_interleaving_instructions, testInstructions * int(args.isa_repetition))
+        return testInstructions * int(args.isa_repetition)
+    return testInstructions
+
+
+def run_job(job):
+    """runs a job (task, runID, loopIteration, args, optional task arguments) of the scheduler"""
+    task, runID, loopIteration, args, *taskArgs = job
+    return task(runID, loopIteration, args, *taskArgs)
 
-def create_basic_instruciton_test(runID, loopIteration, args):
+
+def create_basic_instruciton_test(runID, loopIteration, args, shard=0, shards=1):
     singleInstruction = args.singleInstruction
-    random_ops = RandomOptions(args)
-    Processor(architecture=args.architecture, cacheMiss=float(args.dcacheMiss),
-              newMemoryBlock=float(args.newMemoryBlock))
-    stack = Stack(args.architecture, args.icacheMiss,enabled_extensions=args.isa_extensions)
+    random_ops, stack = get_worker(args)
     
-    singleInstructionTests, testcases, instrCount = stack.create_basic_instruction_test(random_ops=random_ops, singleInstruction=singleInstruction)
-    write_files("basic", singleInstructionTests, runID, loopIteration)
+    singleInstructionTests, testcases, instrCount = stack.create_basic_instruction_test(random_ops=random_ops, singleInstruction=singleInstruction,
+                                                                                       shard=shard, shards=shards, pack=args.pack)
+    files = write_files("basic", singleInstructionTests, runID, loopIteration, args.pack)
     
-    return testcases, instrCount, len(singleInstructionTests)
+    return testcases, instrCount, files
     
     
-def create_complete_instruction_test(runID, loopIteration, args):
+def create_complete_instruction_test(runID, loopIteration, args, shard=0, shards=1):
     singleInstruction = args.singleInstruction
-    random_ops = RandomOptions(args)
-    Processor(architecture=args.architecture, cacheMiss=float(args.dcacheMiss),
-              newMemoryBlock=float(args.newMemoryBlock))
-    stack = Stack(args.architecture, args.icacheMiss,enabled_extensions=args.isa_extensions)
+    random_ops, stack = get_worker(args)
     
-    singleInstructionTests, testcases, instrCount = stack.create_complete_instruction_test(random_ops=random_ops, singleInstruction=singleInstruction)
-    write_files("complete",singleInstructionTests, runID, loopIteration)
+    singleInstructionTests, testcases, instrCount = stack.create_complete_instruction_test(random_ops=random_ops, singleInstruction=singleInstruction,
+                                                                                           shard=shard, shards=shards, pack=args.pack)
+    files = write_files("complete",singleInstructionTests, runID, loopIteration, args.pack)
     
-    return testcases, instrCount, len(singleInstructionTests)
+    return testcases, instrCount, files
 
 
-def createSequence(runID, loopIteration, args):
-    random_ops = RandomOptions(args)
-    Processor(architecture=args.architecture, cacheMiss=float(args.dcacheMiss),
-              newMemoryBlock=float(args.newMemoryBlock))
-    stack = Stack(args.architecture, args.icacheMiss,enabled_extensions=args.isa_extensions)
+def createSequence(runID, loopIteration, args, combinations=None, combinationCount=None):
+    """creates one file for each type combination, combinationCount is only used to schedule the job"""
+    random_ops, stack = get_worker(args)
     
-    instructions = stack.generateSequenceInstructionsList(args.sequenceLength)
+    if combinations is None:
+        combinations = range(stack.getSequenceCombinationCount(args.sequenceLength))
+    instructions = stack.generateSequenceInstructionsList(args.sequenceLength, combinations)
     num_test_instr = 0
     total_instructions = 0
     file_count = 0
-    for instructionList in instructions:
+    # files are numbered by their type combination
+    for combinationIndex, instructionList in zip(combinations, instructions):
         code, testInstr, instrCount = stack.createSequenceInstructions(instructionList, random_ops, args.immediate,
                                                                         args.switch_prob, args.forwarding,
                                                                         args.specialImmediates,
@@ -136,16 +238,10 @@ def createSequence(runID, loopIteration, args):
         filestring += "_dcache_" + str(int(args.dcacheMiss * 100))
         filestring += "_newMemBlock_" + str(int(newMemoryBlock * 100))
         filestring += "_" + str(loopIteration)
-        filestring += "_" + str(file_count)
+        filestring += "_" + str(combinationIndex)
         filestring += "_"+ runID
         filestring += "." + Processor().get_assembler_ending()
-        exportFile = os.path.join(FOLDER_EXPORT_ASSEMBLY, filestring)
-
-        rawfile = open(exportFile, 'w')
-        rawfile.write(header)
-        rawfile.write(code)
-        rawfile.write(footer)
-        rawfile.close()
+        get_writer().write(filestring, header, code, footer)
 
         file_count += 1
         # count_instructions(exportFile, PATH_RISC_V, RESULT_FILE)
@@ -153,10 +249,7 @@ def createSequence(runID, loopIteration, args):
 
 
 def createInterleaving(runID, loopIteration, args):
-    random_ops = RandomOptions(args)
-    Processor(architecture=args.architecture, cacheMiss=float(args.dcacheMiss),
-              newMemoryBlock=float(args.newMemoryBlock))
-    stack = Stack(args.architecture, args.icacheMiss,enabled_extensions=args.isa_extensions)
+    random_ops, stack = get_worker(args)
     
     filestring = "interleaving"
     filestring += "_switch_" + str(int(args.switch_prob * 100))
@@ -172,12 +265,7 @@ def createInterleaving(runID, loopIteration, args):
                                                                         specialImmediates=args.specialImmediates, max_instructions=args.max_interleaving_instructions)
 
 
-    exportFile = os.path.join(FOLDER_EXPORT_ASSEMBLY, filestring)
-    rawfile = open(exportFile, 'w')
-    rawfile.write(header)
-    rawfile.write(code)
-    rawfile.write(footer)
-    rawfile.close()
+    get_writer().write(filestring, header, code, footer)
 
     return testInstr, instrCount, 1
     
@@ -206,6 +294,11 @@ if __name__ == '__main__':
     argument_options.add_argument("--switch_prob","--switch",
                           help="Probability of instructions with switched focusReg and randValue generated. Range from 0.0 - 1.0. Defaults to 0.5.",type=float,
                           default="0.5")
+    argument_options.add_argument("--no_target_cache", help="Do not load or store the processed target (parsed xml files and test instructions) in the target cache. Defaults to False.", action="store_true", default=False)
+    argument_options.add_argument("--output_format", choices=Constants.OUTPUT_FORMATS,
+                                  help="Write each test into its own file (dir) or stream the tests of each thread into one archive with an index (tar, tar.zst, zip). tar.zst needs the zstandard module. Defaults to dir.",
+                                  default=Constants.OUTPUT_DIRECTORY)
+    argument_options.add_argument("--target_cache_dir", help="Directory of the target cache. Defaults to ~/.cache/patara.", default=Constants.FOLDER_TARGET_CACHE)
     
     
     
@@ -217,6 +310,9 @@ if __name__ == '__main__':
     arguments_basic.add_argument("--completeInstruction","-c",
                           help="Will go through all combinations of basic + switch the random and focus register (used for forwarding).",
                           action="store_true")
+    arguments_basic.add_argument("--pack", type=int,
+                          help="Number of consecutive basic or complete tests to pack into one program. The tests of a program are run one after another, each with its own register-file randomization (if enabled) and comparison. A program is split, if it exceeds the imem-size of the processor xml. Defaults to 1 (one test per file).",
+                          default=1)
     
     
     arguments_interleaving = parser.add_argument_group('Interleaving Options')
@@ -226,6 +322,7 @@ if __name__ == '__main__':
                             default="-1")
     arguments_interleaving.add_argument("-l", "--isa_repetition", "--level", help="Number of times that each instruction of the ISA will be used in the interleaving test. max_interleaving_instruction always overrides the total test instruction, if max_interleaving_instruction is -1, the total number of instructions to be used in the sequence is defined by the maximum number of instructions in the instruction set multiplied by the number of levels. Defaults to 1.",type=int,
                           default="1")
+    arguments_interleaving.add_argument("--bounded_memory", help="Keep the test instructions of the interleaving test in a compact log and move the log and the generated assembly to temporary files, if they get large. For very long interleaving tests. Defaults to False.", action="store_true", default=False)
     arguments_interleaving.add_argument("--icacheMiss",
                           help="Probability of incuring Instruction Cache miss. Defaults to 0.5. Not supported on sequences!",
                           default="0.5")
@@ -241,6 +338,12 @@ if __name__ == '__main__':
     arguments_sequence.add_argument("--sequenceLength",
                           help="Give the list of Sequences to iterate through. Defaults to 4. Only works on sequences!",type=int,
                           default=4)
+    arguments_sequence.add_argument("--sequenceSamples",
+                          help="Number of type combinations to draw for the sequences instead of creating all combinations. Defaults to 0 (all combinations). Only works on sequences!",
+                          type=int, default=0)
+    arguments_sequence.add_argument("--sequenceSampling",
+                          help="How the type combinations are drawn with --sequenceSamples: uniform draws each combination with the same probability, stratified lets each type occur equally often at each position of the sequence. Defaults to uniform.",
+                          choices=["uniform", "stratified"], default="uniform")
     arguments_sequence.add_argument("--sequenceStall",
                           help="Probability to stall the pipeline between base instructions with forwarding holes. Defaults to 0.5",
                           default=0.5)
@@ -251,6 +354,7 @@ if __name__ == '__main__':
     randomization_group.add_argument("--randomize_processor_state", help="Randomize processor-state between modification and reverse instruction. This option allone will not randomize the register-file ( use --randomize_processor_state_load or randomize_processor_state_immediate). Hint: Enabling one randomization method, will automatically also set this option. Defaults to False.", action="store_true", default=False)
     randomization_group.add_argument("--randomize_processor_state_load", help="Randomize register-file in the processor-state-randomization between modification and reverse with load instructions. Defaults to False.", action="store_true", default=False)
     randomization_group.add_argument("--randomize_processor_state_immediate", help="Randomize register-file in the processor-state-randomization between modification and reverse with immediate values. Defaults to False.", action="store_true", default=False)
+    randomization_group.add_argument("--immediate_pool", help="Draw random immediates in large batches (with NumPy, if it is installed) and hand them out from a pool. The tests differ from the tests created with the same seed without this option. Defaults to False.", action="store_true", default=False)
     
     
     arguments_template = parser.add_argument_group('Template Options')
@@ -284,6 +388,10 @@ if __name__ == '__main__':
     print_arguments(args, parser)
     
     Constants.TEST_ENABLED = args.test
+    Constants.TARGET_CACHE_ENABLED = not args.no_target_cache
+    Constants.FOLDER_TARGET_CACHE = args.target_cache_dir
+    Constants.BOUNDED_MEMORY = args.bounded_memory
+    Constants.IMMEDIATE_POOL = args.immediate_pool
     
     random_ops = RandomOptions(args)
     
@@ -298,8 +406,10 @@ if __name__ == '__main__':
     dCacheMisses = float(args.dcacheMiss)
     newMemoryBlock = float(args.newMemoryBlock)
 
-    Processor(architecture=args.architecture, cacheMiss=float(dCacheMisses),
-              newMemoryBlock=float(newMemoryBlock))
+    runID = str(int(time.time())) if not args.test else ""
+
+    # load the target before the worker processes are forked, so they share it
+    init_worker(args, runID)
 
     sequenceLength = int(args.sequenceLength)
 
@@ -308,9 +418,7 @@ if __name__ == '__main__':
     immediateProbability = float(args.immediate)
     files = int(args.files)
     singleInstruction = args.singleInstruction
-    stack = Stack(args.architecture, args.icacheMiss,enabled_extensions=args.isa_extensions)
-    instruction_set = DataBank().get_instruction_list()
-    v = ConditionalExecutionCode(args.architecture, instruction_set)
+    random_ops, stack = get_worker(args)
     # prepare Export folder
     createDirectoryIfNew(FOLDER_EXPORT_ASSEMBLY)
     forwardingHole = int(args.forwarding)
@@ -356,7 +464,6 @@ if __name__ == '__main__':
     # n=3
 
     
-    runID = str(int(time.time())) if not args.test else ""
     numberTestInstructions = 0
     totalInstructions = 0
     fileCount =0
@@ -382,49 +489,53 @@ if __name__ == '__main__':
     #         fileCount += 1
     #         exit(0)
     #         # count_instructions(exportFile, PATH_RISC_V, RESULT_FILE)
-    temp_res = []
-
+    # all files of all test types are jobs of one scheduler
+    jobs = []
+    # the combinations of one basic, complete or sequence test are split into one part per thread
+    shards = max(int(args.threads), 1)
     if args.basicInstruction:
-        
-        if args.threads > 1:
-            with multiprocessing.Pool(int(args.threads)) as pool:
-                temp_res.extend(pool.starmap(create_basic_instruciton_test, [(runID, i, args) for i in range(files)]))
-        else:
-            for i in range(files):
-                temp_res.append(create_basic_instruciton_test(runID, i, args))
-        
-       
-    
-    
+        jobs += [(create_basic_instruciton_test, runID, i, args, shard, shards) for i in range(files)
+                 for shard in range(shards)]
     if args.completeInstruction:
-        if args.threads > 1:
-            with multiprocessing.Pool(int(args.threads)) as pool:
-                temp_res.extend(pool.starmap(create_basic_instruciton_test, [(runID, i, args) for i in range(files)]))
-        else:
-            for i in range(files):
-                temp_res.append(create_basic_instruciton_test(runID, i, args))
-        
-
+        jobs += [(create_complete_instruction_test, runID, i, args, shard, shards) for i in range(files)
+                 for shard in range(shards)]
     if args.sequence:
-        if args.threads > 1:
-            with multiprocessing.Pool(int(args.threads)) as pool:
-                temp_res.extend(pool.starmap(createSequence, [(runID, i, args) for i in range(files)]))
-        else:
-            for i in range(files):
-                temp_res.append(createSequence(runID, i, args))
+        # the type combinations of one sequence test are split into one part per thread
+        for i in range(files):
+            if args.sequenceSamples > 0:
+                combinations = stack.sampleSequenceCombinations(args.sequenceLength, args.sequenceSamples,
+                                                                args.sequenceSampling == "stratified")
+                combinationCount = len(combinations)
+            else:
+                # len() of a range fails above sys.maxsize, the count is computed directly
+                combinationCount = stack.getSequenceCombinationCount(args.sequenceLength)
+                combinations = range(combinationCount)
+            bounds = [combinationCount * shard // shards for shard in range(shards + 1)]
+            jobs += [(createSequence, runID, i, args, combinations[bounds[shard]:bounds[shard + 1]],
+                      bounds[shard + 1] - bounds[shard])
+                     for shard in range(shards) if bounds[shard] < bounds[shard + 1]]
+    if args.interleaving:
+        jobs += [(createInterleaving, runID, i, args) for i in range(files)]
+
+    if args.threads > 1:
+        # one pool for all test types, each worker loads the target once. Long jobs are started first and the
+        # results are collected in the order they finish, so no worker waits for the slowest file of a test type
+        jobs.sort(key=estimate_test_instructions, reverse=True)
+        pool = multiprocessing.Pool(int(args.threads), initializer=init_worker, initargs=(args, runID))
+        results = pool.imap_unordered(run_job, jobs)
+    else:
+        pool = None
+        results = map(run_job, jobs)
 
-        
+    for res in results:
+        numberTestInstructions += res[0]
+        totalInstructions += res[1]
+        fileCount += res[2]
 
-    if args.interleaving:
-        if args.threads > 1:
-            with multiprocessing.Pool(int(args.threads)) as pool:
-                temp_res.extend(pool.starmap(createInterleaving, [(runID, i, args) for i in range(files)]))
-        else:
-            for i in range(files):
-                temp_res.append(createInterleaving(runID, i, args))
-        
-           
-            # count_instructions(exportFile, PATH_RISC_V, RESULT_FILE)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    get_writer().close()
 
     # totalInstructions = 0
     # with open(RESULT_FILE, "r") as f:
@@ -432,11 +543,6 @@ if __name__ == '__main__':
     #     for line in lines:
     #         totalInstructions += int(line.split()[-1])
     
-    for res in temp_res:
-        numberTestInstructions += res[0]
-        totalInstructions += res[1]
-        fileCount += res[2]
-
 
     print(f"Test Files generated        : {fileCount}")
     print("Test Instructions executed   : " + str(numberTestInstructions))
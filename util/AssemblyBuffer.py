@@ -0,0 +1,64 @@
+# Copyright (c) 2022 Chair for Chip Design for Embedded Computing,
+#                    Technische Universitaet Braunschweig, Germany
+#                    www.tu-braunschweig.de/en/eis
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT
+
+import shutil
+import tempfile
+
+import Constants
+
+
+class AssemblyBuffer:
+    """Collects the assembly fragments of a test.
+
+    Fragments are appended with += like strings, but they are only kept in a list. The test is written to the
+    assembly file fragment by fragment, so a test file is never concatenated in memory.
+    In bounded memory mode (Constants.BOUNDED_MEMORY) the fragments are moved to a temporary file, if they exceed
+    BOUNDED_MEMORY_SPILL_SIZE characters.
+    """
+
+    def __init__(self, fragment=""):
+        self._fragments = []
+        self._size = 0
+        self._spillFile = None
+        self.__iadd__(fragment)
+
+    def __iadd__(self, fragment):
+        if isinstance(fragment, AssemblyBuffer):
+            if fragment._spillFile is not None:
+                fragment._spillFile.seek(0)
+                for chunk in iter(lambda: fragment._spillFile.read(2 ** 20), ""):
+                    self._append(chunk)
+            for f in fragment._fragments:
+                self._append(f)
+        elif fragment:
+            self._append(fragment)
+        return self
+
+    def _append(self, fragment):
+        self._fragments.append(fragment)
+        self._size += len(fragment)
+        if Constants.BOUNDED_MEMORY and self._size > Constants.BOUNDED_MEMORY_SPILL_SIZE:
+            if self._spillFile is None:
+                self._spillFile = tempfile.TemporaryFile('w+')
+            self._spillFile.seek(0, 2)
+            self._spillFile.writelines(self._fragments)
+            self._fragments = []
+            self._size = 0
+
+    def __str__(self) -> str:
+        if self._spillFile is not None:
+            self._spillFile.seek(0)
+            return self._spillFile.read() + "".join(self._fragments)
+        return "".join(self._fragments)
+
+    def writeTo(self, file):
+        """writes all fragments to the opened file"""
+        if self._spillFile is not None:
+            self._spillFile.seek(0)
+            shutil.copyfileobj(self._spillFile, file)
+        file.writelines(self._fragments)
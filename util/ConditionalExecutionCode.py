@@ -9,10 +9,10 @@
 import copy
 from typing import List
 
-import xmltodict
-
 from Constants import *
+from util.GenerationContext import GenerationContext
 from util.Instruction import Instruction
+from util.TargetDescription import TargetDescription
 
 
 class ConditionalExecutionCode:
@@ -30,12 +30,11 @@ class ConditionalExecutionCode:
 
         def initialize(self, architecture):
             self.immediateAssembly = None
-            file = open(get_path_instruction(architecture))
-            xml_content = xmltodict.parse(file.read())
+            xml_content = TargetDescription(architecture).getInstructionXML()
 
-            for group in xml_content[INST_LIST]:
+            for group in xml_content:
                 if group == CONDITIONAL_READ:
-                    conditionVariants = xml_content[INST_LIST][CONDITIONAL_READ]
+                    conditionVariants = xml_content[CONDITIONAL_READ]
                     for condition in conditionVariants:
                         self.conditionalData[condition] = {}
                         for conditionFlag in conditionVariants[condition]:
@@ -62,7 +61,13 @@ class ConditionalExecutionCode:
     instance = None
 
     def __init__(self, architecture="rv32imc", instruction_set=[]):
-        if not ConditionalExecutionCode.instance:
+        context = GenerationContext.current()
+        if context is not None:
+            if context.conditionalExecutionCode is None:
+                context.conditionalExecutionCode = ConditionalExecutionCode.__ConditionalExecutionCode(
+                    context.architecture, instruction_set)
+            self.instance = context.conditionalExecutionCode
+        elif not ConditionalExecutionCode.instance:
             ConditionalExecutionCode.instance = ConditionalExecutionCode.__ConditionalExecutionCode(architecture, instruction_set)
         n = 3
 
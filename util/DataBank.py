@@ -7,14 +7,14 @@
 # https://opensource.org/licenses/MIT
 
 import copy
-import random
 from typing import List
 
-import xmltodict
-
 from Constants import *
+from util.GenerationContext import GenerationContext
 from util.Instruction import Instruction
 from util.Processor import Processor
+from util.TargetCache import TargetCache
+from util.TargetDescription import TargetDescription
 from util.TestInstruction import TestInstruction
 
 
@@ -26,6 +26,10 @@ class DataBank:
             self._dict = {}
             self.interleaving_random_to_memory = {}
             self.ICacheMissInstruction = []
+            # register file randomization code, see DataBank.assemblyRandomizeRegisterFile
+            self.randomizeRegisterFileCache = {}
+            # parsed once per target and shared with Processor and ConditionalExecutionCode
+            self.instructionXML = TargetDescription(architecture).getInstructionXML()
             self._readImmediateAssembly()
             self.read_xml()
             self._read_comparison_xml()
@@ -37,32 +41,7 @@ class DataBank:
             n = 3
 
         def _isInstruction(self, key):
-            if key == COMPARISON:
-                return False
-            if key == INSTRUCTION_DEFAULT_MODES:
-                return False
-            if key == INIT:
-                return False
-            if key == POST_INIT:
-                return False
-            if key == IMMEDIATE_ASSEMBLY:
-                return False
-            if key == CONDITIONAL_READ:
-                return False
-            if key == END_SIMULATION:
-                return False
-            if key == GLOBAL_PRE_SEQUENCE:
-                return False
-            if key == FIX_IMM_VALUE:
-                return False
-            if key == PRE_REVERSE_PROCESSOR_STATE:
-                return False
-            if key == PRE_REVERSE_POST_REG_INIT_PROCESSOR_STATE:
-                return False
-            if key == POST_REVERSE_PROCESSOR_STATE:
-                return False
-
-            return True
+            return TargetDescription(self.architecture).isInstruction(key)
 
         def __parseInstructions(self, dictInstruction, instruction_list):
             result = []
@@ -84,40 +63,37 @@ class DataBank:
 
         def _readImmediateAssembly(self):
             self.immediateAssembly = None
-            file = open(get_path_instruction(self.architecture))
-            xml_content = xmltodict.parse(file.read())
+            xml_content = self.instructionXML
             
-            instruction_list = [instr.lower() for instr in list(xml_content[INST_LIST]) if SATURATION in xml_content[INST_LIST][instr] and instr != INSTRUCTION_DEFAULT_MODES]
+            instruction_list = [instr.lower() for instr in list(xml_content) if SATURATION in xml_content[instr] and instr != INSTRUCTION_DEFAULT_MODES]
 
-            for group in xml_content[INST_LIST]:
+            for group in xml_content:
                 if group == IMMEDIATE_ASSEMBLY:
-                    immidateVariants = xml_content[INST_LIST][IMMEDIATE_ASSEMBLY]
+                    immidateVariants = xml_content[IMMEDIATE_ASSEMBLY]
                     self.immediateAssembly = {}
                     for imm in immidateVariants or []:
                         self.immediateAssembly[imm] = {}
-                        if INSTR in xml_content[INST_LIST][IMMEDIATE_ASSEMBLY][imm]:
-                            instr = xml_content[INST_LIST][IMMEDIATE_ASSEMBLY][imm][INSTR]
+                        if INSTR in xml_content[IMMEDIATE_ASSEMBLY][imm]:
+                            instr = xml_content[IMMEDIATE_ASSEMBLY][imm][INSTR]
                             instructions = self.__parseInstructions(instr, instruction_list)
                             self.immediateAssembly[imm][V_MUTABLE] = instructions
                         else:
-                            for simd in xml_content[INST_LIST][IMMEDIATE_ASSEMBLY][imm]:
-                                instr = xml_content[INST_LIST][IMMEDIATE_ASSEMBLY][imm][simd][INSTR]
+                            for simd in xml_content[IMMEDIATE_ASSEMBLY][imm]:
+                                instr = xml_content[IMMEDIATE_ASSEMBLY][imm][simd][INSTR]
                                 instructions = self.__parseInstructions(instr, instruction_list)
                                 self.immediateAssembly[imm][simd] = instructions
 
         def read_xml(self):
-            file = open(get_path_instruction(self.architecture))
-            self.xml_content = xmltodict.parse(file.read())
             self.testinstruction_list = []
             self.instruction_set = []
             # generate Characteristics Dictionary about Instructions
-            for instr in self.xml_content[INST_LIST]:
+            for instr in self.instructionXML:
                 if not self._isInstruction(instr):
                     continue
                 
                 # check if instruction is in the enabled isa extension
-                if self.enabled_extensions != "" and ISA_EXTENSION in self.xml_content[INST_LIST][instr]:
-                    if self.xml_content[INST_LIST][instr][ISA_EXTENSION] not in self.enabled_extensions:
+                if self.enabled_extensions != "" and ISA_EXTENSION in self.instructionXML[instr]:
+                    if self.instructionXML[instr][ISA_EXTENSION] not in self.enabled_extensions:
                         continue
                 
                 # handle interleaving memory instructions
@@ -130,21 +106,21 @@ class DataBank:
                 
 
             # generate TestInstructions
-            for instr in self.xml_content[INST_LIST]:
+            for instr in self.instructionXML:
                 if not self._isInstruction(instr):
                     continue
                 
                 # check if instruction is in the enabled isa extension
-                if self.enabled_extensions != "" and ISA_EXTENSION in self.xml_content[INST_LIST][instr]:
-                    if self.xml_content[INST_LIST][instr][ISA_EXTENSION] not in self.enabled_extensions:
+                if self.enabled_extensions != "" and ISA_EXTENSION in self.instructionXML[instr]:
+                    if self.instructionXML[instr][ISA_EXTENSION] not in self.enabled_extensions:
                         continue
                 
                 if INTERLEAVING_RANDOM_TO_MEMORY in instr:
-                    self.interleaving_random_to_memory[PRE_KEY] = self.__parseInstructions(self.xml_content[INST_LIST][INTERLEAVING_RANDOM_TO_MEMORY][PRE_KEY][INSTR], self.instruction_set)
-                    self.interleaving_random_to_memory[POST_KEY] = self.__parseInstructions(self.xml_content[INST_LIST][INTERLEAVING_RANDOM_TO_MEMORY][POST_KEY][INSTR], self.instruction_set)
+                    self.interleaving_random_to_memory[PRE_KEY] = self.__parseInstructions(self.instructionXML[INTERLEAVING_RANDOM_TO_MEMORY][PRE_KEY][INSTR], self.instruction_set)
+                    self.interleaving_random_to_memory[POST_KEY] = self.__parseInstructions(self.instructionXML[INTERLEAVING_RANDOM_TO_MEMORY][POST_KEY][INSTR], self.instruction_set)
                     continue
 
-                temp = self.xml_content[INST_LIST][instr]
+                temp = self.instructionXML[instr]
                 original = temp[INSTR]
                 original = [original] if isinstance(original, str) else original
                 if PRE_SEQUENCE_INSTR in temp:
@@ -171,8 +147,8 @@ class DataBank:
                     postSequence = []
                 reverse = self._extractReverseSIMD(temp)
                 specialization = {}
-                if SPECIALIZATION in self.xml_content[INST_LIST][instr]:
-                    specialization = self.xml_content[INST_LIST][instr][SPECIALIZATION]
+                if SPECIALIZATION in self.instructionXML[instr]:
+                    specialization = self.instructionXML[instr][SPECIALIZATION]
 
                 instrType = self._getInstructionType(temp)
                 intImms = self._getSpecialImmediates(temp)
@@ -192,12 +168,32 @@ class DataBank:
                                                   icacheMissCandidate=icacheMissCandidate,
                                                   iCacheRepetition=iCacheRepetition, signed_unsigned=wrong_sign)
                 self.testinstruction_list.append(testInstruction)
-                if testInstruction.isImemCacheMissCandidate():
-                    temp = copy.deepcopy(testInstruction)
-                    temp.setICacheJump()
-                    self.ICacheMissInstruction.append(temp)
-
-            file.close()
+                self._addICacheMissInstruction(testInstruction)
+
+        def _addICacheMissInstruction(self, testInstruction):
+            if testInstruction.isImemCacheMissCandidate():
+                temp = testInstruction.clone()
+                temp.setICacheJump()
+                self.ICacheMissInstruction.append(temp)
+
+        def getCacheState(self) -> dict:
+            """returns the processed target for the target cache. The shared xml content, the icache miss
+            instructions (copies of the test instructions) and the generated code are not stored."""
+            state = dict(vars(self))
+            del state['instructionXML']
+            del state['ICacheMissInstruction']
+            del state['randomizeRegisterFileCache']
+            return state
+
+        def setCacheState(self, state):
+            self.__dict__.update(state)
+            self.instructionXML = TargetDescription(self.architecture).getInstructionXML()
+            self.randomizeRegisterFileCache = {}
+            # issue slots are drawn for each DataBank, do not reuse the slots of the cached one
+            self.ICacheMissInstruction = []
+            for testInstruction in self.testinstruction_list:
+                testInstruction.randomizeIssueSlot()
+                self._addICacheMissInstruction(testInstruction)
 
         def _getInstructionType(self, temp):
             type = ""
@@ -219,11 +215,11 @@ class DataBank:
             return I_CACHE_MISS_CANDIDATE in temp
 
         def getICacheMissTestInstruction(self):
-            return copy.deepcopy(random.choice(self.ICacheMissInstruction))
+            return GenerationContext.getRandom().choice(self.ICacheMissInstruction).clone()
 
         def _readFixedImmediate(self):
-            if FIX_IMM_VALUE in self.xml_content[INST_LIST]:
-                fixedInstructions = self.xml_content[INST_LIST][FIX_IMM_VALUE][INSTR]
+            if FIX_IMM_VALUE in self.instructionXML:
+                fixedInstructions = self.instructionXML[FIX_IMM_VALUE][INSTR]
                 if isinstance(fixedInstructions, str):
                     fixedInstructions = [fixedInstructions]
 
@@ -256,18 +252,18 @@ class DataBank:
 
 
         def __importSpecialInstructions(self, keyword):
-            if keyword in self.xml_content[INST_LIST]:
+            if keyword in self.instructionXML:
                 instruction_list = []
-                if INSTR in self.xml_content[INST_LIST][keyword]:
-                    for instr in self.xml_content[INST_LIST][keyword][INSTR]:
+                if INSTR in self.instructionXML[keyword]:
+                    for instr in self.instructionXML[keyword][INSTR]:
                         instruction = Instruction(instr, self.instruction_set)
                         instruction_list.append(instruction)
                     return instruction_list
                 else:
                     instruction_dict = {}
-                    for key in self.xml_content[INST_LIST][keyword]:
+                    for key in self.instructionXML[keyword]:
                         instruction_dict[key] = []
-                        for instr in self.xml_content[INST_LIST][keyword][key][INSTR]:
+                        for instr in self.instructionXML[keyword][key][INSTR]:
                             instruction = Instruction(instr, self.instruction_set)
                             instruction_dict[key].append(instruction)
                     return instruction_dict
@@ -280,7 +276,7 @@ class DataBank:
                         
 
         def _addDictEntry(self, instr):
-            self._dict[instr] = copy.deepcopy(self.xml_content[INST_LIST][instr])
+            self._dict[instr] = copy.deepcopy(self.instructionXML[instr])
             del self._dict[instr][INSTR]
             del self._dict[instr][REVERSE]
             if SEQUENCE_INSTR in self._dict[instr]:
@@ -303,34 +299,30 @@ class DataBank:
 
         def _read_comparison_xml(self) -> list:
             """Reads xml to parse the comparison code."""
-            file = open(get_path_instruction(self.architecture))
-            parser = xmltodict.parse(file.read())
-            return_list = parser[INST_LIST][COMPARISON][INSTR]
+            return_list = self.instructionXML[COMPARISON][INSTR]
 
             self._comparisonCode = return_list
 
         def _readGlobalPreSequence(self) -> list:
             """Reads xml to parse the GlobalPrePlain code."""
-            file = open(get_path_instruction(self.architecture))
-            parser = xmltodict.parse(file.read())
+            parser = self.instructionXML
 
             return_list = []
-            if GLOBAL_PRE_SEQUENCE in parser[INST_LIST]:
-                if isinstance(parser[INST_LIST][GLOBAL_PRE_SEQUENCE][INSTR], list):
-                    return_list = parser[INST_LIST][GLOBAL_PRE_SEQUENCE][INSTR]
+            if GLOBAL_PRE_SEQUENCE in parser:
+                if isinstance(parser[GLOBAL_PRE_SEQUENCE][INSTR], list):
+                    return_list = parser[GLOBAL_PRE_SEQUENCE][INSTR]
                 else:
-                    return_list = [parser[INST_LIST][GLOBAL_PRE_SEQUENCE][INSTR]]
+                    return_list = [parser[GLOBAL_PRE_SEQUENCE][INSTR]]
 
             self._globalPrePlain = return_list
 
         def _read_init_register(self) -> list:
-            file = open(get_path_instruction(self.architecture))
-            parser = xmltodict.parse(file.read())
+            parser = self.instructionXML
             
-            if not REGISTER in parser[INST_LIST][INIT]:
+            if not REGISTER in parser[INIT]:
                 self._listInitRegister = {}
                 for KEYWORD in [IMMEDIATE, MEMORY]:
-                    return_list = parser[INST_LIST][INIT][KEYWORD][REGISTER]
+                    return_list = parser[INIT][KEYWORD][REGISTER]
 
                     # guarantee a list
                     if not isinstance(return_list, list):
@@ -339,7 +331,7 @@ class DataBank:
             else:
                 # legacy mode for backward compatibility
                 self._listInitRegister = []
-                return_list = parser[INST_LIST][INIT][KEYWORD][REGISTER]
+                return_list = parser[INIT][KEYWORD][REGISTER]
 
                 # guarantee a list
                 if not isinstance(return_list, list):
@@ -350,10 +342,9 @@ class DataBank:
         def _readPostInit(self):
             self._listPostInit = {}
 
-            file = open(get_path_instruction(self.architecture))
-            parser = xmltodict.parse(file.read())
-            if POST_INIT in parser[INST_LIST]:
-                return_list = parser[INST_LIST][POST_INIT][INSTR]
+            parser = self.instructionXML
+            if POST_INIT in parser:
+                return_list = parser[POST_INIT][INSTR]
                 self._listPostInit = return_list
 
         def getFixedImmediateCode(self, operands, immediate):
@@ -378,8 +369,25 @@ class DataBank:
     instance = None
 
     def __init__(self, architecture="rv32imc", enabled_extensions=""):
-        if not DataBank.instance:
-            DataBank.instance = DataBank.__Databank(architecture, enabled_extensions)
+        context = GenerationContext.current()
+        if context is not None:
+            if context.dataBank is None:
+                context.dataBank = DataBank._load(context.architecture, context.enabled_extensions)
+            self.instance = context.dataBank
+        elif not DataBank.instance:
+            DataBank.instance = DataBank._load(architecture, enabled_extensions)
+
+    @staticmethod
+    def _load(architecture, enabled_extensions):
+        cache = TargetCache(architecture, TARGET_CACHE_DATABANK, enabled_extensions)
+        state = cache.load()
+        if state is None:
+            instance = DataBank.__Databank(architecture, enabled_extensions)
+            cache.store(instance.getCacheState())
+        else:
+            instance = object.__new__(DataBank.__Databank)
+            instance.setCacheState(state)
+        return instance
 
     def getTestInstructions(self) -> List[TestInstruction]:
         return self.instance.testinstruction_list
@@ -425,59 +433,69 @@ class DataBank:
         :param randomize_immediate: flag to randomize immediate, if false randomize register file from memory
         :return: Assembly code for randomizing register file
         '''
-        immediateType = Processor().getImmediateDefault()
         self.initRegCounter = 0
-        # Initialize all Registers with random value
+        cache = self.instance.randomizeRegisterFileCache
+        if randomize_immediate:
+            # only the random immediates change between calls
+            if IMMEDIATE not in cache:
+                cache[IMMEDIATE] = self._createRandomizeRegisterFileTemplate()
+            code = []
+            for parts, immediateType in cache[IMMEDIATE][0]:
+                code.append(Processor().createRandImmediate(immediateType).join(parts))
+            code.append(cache[IMMEDIATE][1])
+        else:
+            # loads only depend on the target and the start address
+            if start_address not in cache:
+                cache[start_address] = self._createRandomizeRegisterFileLoads(start_address)
+            code = [cache[start_address]]
+        self.initRegCounter += 1
+        return "".join(code)
 
+    def _getRandomizedRegisterOperands(self) -> List[str]:
+        """returns the operands of all registers, that are initialized with random values"""
         reg_rule = Processor().get_register_rule()
-        max_reg_file = reg_rule[NUM_REG_FILES]
-        max_reg_size = reg_rule[REG_FILE_SIZE]
-
-        init_csv = self.getInitRegister(randomize_immediate)
         IgnoredRegister = Processor().getIgnoreRegister()
+        return [Processor().createRegisterOperand(bank, register)
+                for bank in range(reg_rule[NUM_REG_FILES] + 1) for register in range(reg_rule[REG_FILE_SIZE] + 1)
+                if [bank, register] not in IgnoredRegister]  # Don't initialize ignored registers
 
+    def _createRandomizeRegisterFileTemplate(self):
+        """returns the register file randomization with immediates as list of (code split at the random value,
+        immediate type) and the code after the randomization"""
+        immediateType = Processor().getImmediateDefault()
+        template = []
+        for reg_operand in self._getRandomizedRegisterOperands():
+            for instr in self.getInitRegister(True):
+                instrImmediateType = instr[MANDATORY_FEATURE][IMMEDIATE] if isinstance(instr, dict) and \
+                    instr[MANDATORY_FEATURE][IMMEDIATE] else immediateType
+                instr = instr[PLACEHOLDER] if isinstance(instr, dict) else instr
+                instr = str(instr).replace(OPERANDS.TARGET_REGISTER.value, reg_operand) + '\n'
+                template.append((instr.split(OPERANDS.RAND_VALUE.value), instrImmediateType))
+
+        if isinstance(self.getPostInitCode(), str):
+            postInit = self.getPostInitCode()
+        else:
+            postInit = "\n".join(self.getPostInitCode())
+        if OPERANDS.BRANCH_INDEX.value in postInit:
+            postInit = postInit.replace(OPERANDS.BRANCH_INDEX.value, str(self.initRegCounter))
+        return template, "\n" + postInit + "\n\n"
 
+    def _createRandomizeRegisterFileLoads(self, start_address) -> str:
+        """returns the register file randomization with loads from start_address on"""
         address = start_address
-        code = ''
-        for bank in range(max_reg_file + 1):
-            for register in range(max_reg_size + 1):
-                if [bank, register] in IgnoredRegister:  # Don't initialize ignored registers
-                    continue
-                reg_operand = Processor().createRegisterOperand(bank, register)
-                for instr in init_csv:
-                    if randomize_immediate:
-                        immediate = Processor().createRandImmediate(
-                            instr[MANDATORY_FEATURE][IMMEDIATE] if isinstance(instr, dict) and instr[MANDATORY_FEATURE][
-                                IMMEDIATE] else immediateType)
-                        instr = instr[PLACEHOLDER] if isinstance(instr, dict) else instr
-                        instr = instr.replace(OPERANDS.TARGET_REGISTER.value, reg_operand)
-                        instr = instr.replace(OPERANDS.RAND_VALUE.value, immediate)
-                        code += str(instr)
-                        code += '\n'
-                    else:
-                        # randomize register file from memory
-                        instr = instr[PLACEHOLDER] if isinstance(instr, dict) else instr
-                        instr = instr.replace(OPERANDS.TARGET_REGISTER.value, reg_operand)
-                        instr = instr.replace(PROCESSOR_MEMORY_ADDRESS_KEYWORD.upper(), str(address))
-                        code += str(instr)
-                        code += '\n'
-                        address = Processor().get_next_address(address=address)
-                        
-
-        code += "\n"
-        if randomize_immediate:
-            if isinstance(self.getPostInitCode(), str):
-                postInit = self.getPostInitCode()
-            else:
-                postInit = "\n".join(self.getPostInitCode())
-
-            if OPERANDS.BRANCH_INDEX.value in postInit:
-                postInit = postInit.replace(OPERANDS.BRANCH_INDEX.value, str(self.initRegCounter))
-            code += postInit
-            code += "\n"
-        code += "\n"
-        self.initRegCounter += 1
-        return code
+        code = []
+        init_csv = self.getInitRegister(False)
+        for reg_operand in self._getRandomizedRegisterOperands():
+            for instr in init_csv:
+                # randomize register file from memory
+                instr = instr[PLACEHOLDER] if isinstance(instr, dict) else instr
+                instr = instr.replace(OPERANDS.TARGET_REGISTER.value, reg_operand)
+                instr = instr.replace(PROCESSOR_MEMORY_ADDRESS_KEYWORD.upper(), str(address))
+                code.append(str(instr))
+                code.append('\n')
+                address = Processor().get_next_address(address=address)
+        code.append("\n\n")
+        return "".join(code)
 
     def randomizeProcessorState(self, operands, random_ops):
         if len(self.instance.preReverseProcessorState) == 0:
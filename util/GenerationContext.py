@@ -0,0 +1,61 @@
+# Copyright (c) 2022 Chair for Chip Design for Embedded Computing,
+#                    Technische Universitaet Braunschweig, Germany
+#                    www.tu-braunschweig.de/en/eis
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT
+
+import random
+from contextvars import ContextVar
+
+_activeContext = ContextVar("GenerationContext", default=None)
+
+
+class GenerationContext:
+    """Target model, random number generator and generation state (register and memory allocation) of one target.
+
+    Processor, DataBank and ConditionalExecutionCode are facades. Without an active context they share one object per
+    process, the first construction wins. Inside a context they use the objects of the context, which are created for
+    the architecture of the context on first use. The active context is a context variable, so each thread can
+    generate for its own target. A context must only be active in one thread at a time.
+
+    Inside a context all random decisions are drawn from the generator of the context (see getRandom), so a context
+    with a seed creates the same tests, even if other contexts generate in other threads. Without an active context
+    the random module is used.
+
+        with GenerationContext("vliw", seed=1):
+            ConditionalExecutionCode("vliw", DataBank().get_instruction_list())
+            stack = Stack("vliw", 0.0, "")
+            code, testInstructions, instructionCount = stack.createSingleInstructions()
+    """
+
+    def __init__(self, architecture="rv32imc", enabled_extensions="", cacheMiss=0.0, newMemoryBlock=0.0, seed=None):
+        self.architecture = architecture
+        self.random = random.Random(seed)
+        self.enabled_extensions = enabled_extensions
+        self.cacheMiss = cacheMiss
+        self.newMemoryBlock = newMemoryBlock
+        # created by the facades
+        self.processor = None
+        self.dataBank = None
+        self.conditionalExecutionCode = None
+        self._tokens = []
+
+    def __enter__(self):
+        self._tokens.append(_activeContext.set(self))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _activeContext.reset(self._tokens.pop())
+
+    @staticmethod
+    def current():
+        """returns the active GenerationContext or None"""
+        return _activeContext.get()
+
+    @staticmethod
+    def getRandom():
+        """returns the random number generator of the active GenerationContext or the random module"""
+        context = _activeContext.get()
+        return random if context is None else context.random
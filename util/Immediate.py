@@ -0,0 +1,23 @@
+# Copyright (c) 2022 Chair for Chip Design for Embedded Computing,
+#                    Technische Universitaet Braunschweig, Germany
+#                    www.tu-braunschweig.de/en/eis
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT
+
+
+class Immediate(str):
+    """Immediate operand, that also keeps its integer value.
+
+    Immediates are used as strings in the assembly, the value allows taking bit ranges without parsing the operand
+    string again.
+    """
+
+    def __new__(cls, operand: str, value: int):
+        immediate = super().__new__(cls, operand)
+        immediate.value = value
+        return immediate
+
+    def __reduce__(self):
+        return Immediate, (str(self), self.value)
@@ -0,0 +1,49 @@
+# Copyright (c) 2022 Chair for Chip Design for Embedded Computing,
+#                    Technische Universitaet Braunschweig, Germany
+#                    www.tu-braunschweig.de/en/eis
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT
+
+import Constants
+from util.GenerationContext import GenerationContext
+from util.Immediate import Immediate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ImmediatePool:
+    """Pre-drawn random immediate operands.
+
+    For each maximum value IMMEDIATE_POOL_SIZE random values are drawn and formatted to immediate operands at once,
+    then they are handed out one by one. With NumPy the values are drawn as an array from a generator, that is seeded
+    from the random module, so runs with the same seed create the same immediates. Without NumPy the values are drawn
+    with the random module.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix  # immediate operand format in front of the hex value
+        self._pools = {}  # maximum value -> list of immediate operands
+
+    def get(self, maxValue: int) -> str:
+        """returns a random immediate operand between 0 and maxValue"""
+        pool = self._pools.get(maxValue)
+        if not pool:
+            pool = self._draw(maxValue, Constants.IMMEDIATE_POOL_SIZE)
+            self._pools[maxValue] = pool
+        return pool.pop()
+
+    def _draw(self, maxValue: int, size: int) -> list:
+        if numpy is not None and maxValue < 2 ** 64:
+            generator = numpy.random.default_rng(GenerationContext.getRandom().getrandbits(64))
+            values = generator.integers(0, maxValue, size=size, dtype=numpy.uint64, endpoint=True).tolist()
+        else:
+            rng = GenerationContext.getRandom()
+            values = [rng.randint(0, maxValue) for _ in range(size)]
+        # all values are formatted by one format operation
+        operands = ((self.prefix.replace("%", "%%") + "%x\0") * len(values) % tuple(values)).split("\0")[:-1]
+        return list(map(Immediate, operands, values))
@@ -42,6 +42,19 @@ class Instruction:
         # parse immediate features
         self.allows_immediate = self.parsestring[1].split(",")[-1].strip() == OPERANDS.RAND_VALUE.value
     
+    def clone(self):
+        """
+        Copy for an independent use of the instruction. The parsed template (assembly, features, mandatory features)
+        is shared, only the state changed during code generation is copied.
+        :return: the copied instruction
+        """
+        instruction = copy.copy(self)
+        instruction.parsestring = list(self.parsestring)
+        instruction.globalMandatoryFeatures = dict(self.globalMandatoryFeatures)
+        instruction._enabledfeatures = dict(self._enabledfeatures)
+        instruction._operandAttr = dict(self._operandAttr)
+        return instruction
+
     def _is_instruction_mutable(self, instruction_list):
         if self.mutable:
             if self.inst_name.startswith("--"):
@@ -89,7 +102,7 @@ class Instruction:
         :return:
         """
         self._enabledfeatures = {}
-        availableFeatures = Processor().getAvailableInstructionFeaturesNames(self.inst_name)
+        availableFeatures = Processor().getInstructionFeatureNames(self.inst_name) or {}
 
         for key in features:
             if key in availableFeatures:
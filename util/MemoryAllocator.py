@@ -0,0 +1,130 @@
+# Copyright (c) 2022 Chair for Chip Design for Embedded Computing,
+#                    Technische Universitaet Braunschweig, Germany
+#                    www.tu-braunschweig.de/en/eis
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT
+
+from util.GenerationContext import GenerationContext
+
+
+class DataMemoryExhausted(Exception):
+    """Raised if no free address is left in the dmem"""
+
+
+class MemoryAllocator:
+    """Blocked bytes of the data memory.
+
+    Blocked bytes are stored in a bitmap (one byte per address, starting at the base address), so checking an address
+    range does not depend on the number of blocked addresses. Random free addresses are drawn with rank/select on a
+    Fenwick tree of the free aligned addresses.
+    """
+
+    def __init__(self, base=0):
+        self.base = base
+        self._bitmap = bytearray()
+        self._belowBase = set()  # blocked addresses below the base address
+        self._freeSlots = {}  # (start, end, step) -> _FreeSlots
+        self.lastAddress = None  # last blocked address
+
+    def isEmpty(self) -> bool:
+        return self.lastAddress is None
+
+    def block(self, address, length=1):
+        """blocks length bytes starting at address"""
+        for blockedAddress in range(address, address + length):
+            if not self.isBlocked(blockedAddress):
+                index = blockedAddress - self.base
+                if index < 0:
+                    self._belowBase.add(blockedAddress)
+                else:
+                    if index >= len(self._bitmap):
+                        self._bitmap.extend(bytes(max(index + 1 - len(self._bitmap), len(self._bitmap))))
+                    self._bitmap[index] = 1
+                for freeSlots in self._freeSlots.values():
+                    freeSlots.block(blockedAddress)
+            self.lastAddress = blockedAddress
+
+    def isBlocked(self, address, length=1) -> bool:
+        """returns True if any byte of address to address + length - 1 is blocked"""
+        return self.getLastBlocked(address, length) is not None
+
+    def getLastBlocked(self, address, length=1):
+        """returns the highest blocked address of address to address + length - 1 or None if all are free"""
+        start = max(address - self.base, 0)
+        end = address + length - self.base
+        if start < end:
+            index = self._bitmap.rfind(1, start, end)
+            if index != -1:
+                return index + self.base
+        for blockedAddress in reversed(range(address, min(address + length, self.base))):
+            if blockedAddress in self._belowBase:
+                return blockedAddress
+        return None
+
+    def getFreeAddresses(self, start, end, step, length) -> list:
+        """returns all addresses of range(start, end, step) for which length bytes are free"""
+        free = []
+        address = start
+        while address < end:
+            blocked = self.getLastBlocked(address, length)
+            if blocked is None:
+                free.append(address)
+                address += step
+            else:
+                # the next candidate starts behind the blocked byte
+                address += ((blocked - address) // step + 1) * step
+        return free
+
+    def getRandomFreeAddress(self, start, end, step):
+        """returns a random free address of range(start, end + 1, step), all free addresses are equally likely.
+        Returns None, if no address is free."""
+        key = (start, end, step)
+        if key not in self._freeSlots:
+            self._freeSlots[key] = _FreeSlots(self, start, end, step)
+        freeSlots = self._freeSlots[key]
+        if freeSlots.free == 0:
+            return None
+        return freeSlots.select(GenerationContext.getRandom().randrange(freeSlots.free))
+
+
+class _FreeSlots:
+    """Fenwick tree over the free addresses of range(start, end + 1, step)"""
+
+    def __init__(self, allocator: MemoryAllocator, start, end, step):
+        self.start = start
+        self.step = step
+        self.size = len(range(start, end + 1, step))
+        self.tree = [0] * (self.size + 1)
+        for i in range(self.size):
+            self.tree[i + 1] = 0 if allocator.isBlocked(start + i * step) else 1
+        self.free = sum(self.tree)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self.topBit = 1 << (self.size.bit_length() - 1) if self.size else 0
+
+    def block(self, address):
+        offset = address - self.start
+        if offset < 0 or offset % self.step:
+            return
+        i = offset // self.step + 1
+        if i > self.size:
+            return
+        self.free -= 1
+        while i <= self.size:
+            self.tree[i] -= 1
+            i += i & -i
+
+    def select(self, rank):
+        """returns the free address with the given rank (0 is the lowest free address)"""
+        position = 0
+        bit = self.topBit
+        while bit:
+            if position + bit <= self.size and self.tree[position + bit] <= rank:
+                position += bit
+                rank -= self.tree[position]
+            bit >>= 1
+        return self.start + position * self.step
@@ -6,15 +6,20 @@
 # license that can be found in the LICENSE file or at
 # https://opensource.org/licenses/MIT
 
+from collections import OrderedDict
 from multiprocessing import current_process
-import random
-from random import randint, uniform, randrange, shuffle
+import re
 from threading import Lock
 from typing import Dict, List, Union
 
-import xmltodict
-
 from Constants import *
+import Constants
+from util.GenerationContext import GenerationContext
+from util.Immediate import Immediate
+from util.ImmediatePool import ImmediatePool
+from util.MemoryAllocator import DataMemoryExhausted, MemoryAllocator
+from util.RegisterAllocator import RegisterAllocator
+from util.TargetDescription import TargetDescription
 
 
 class Processor:
@@ -25,10 +30,14 @@ class Processor:
             self.newMemoryBlock = newMemoryBlock
             self.branchIndex = -1
             self.startAddress = -1
-            # check if file exists
-            self.proc_infos = self.fetch_xml_data(get_path_processor(architecture))[
-                PROCESSOR]  # content of processor file
-            self.instructionXML = self.fetch_xml_data(get_path_instruction(architecture))[INST_LIST]
+            self.operandTemplates = {}  # compiled operand strings, see Processor.compileOperandTemplate
+            # xml files are parsed once per target and shared
+            target = TargetDescription(architecture)
+            self.target = target
+            self.featureAssembly = {}  # assembly of the allowed feature attributes for each instruction
+            self.mnemonics = OrderedDict()  # rendered mnemonics, see Processor.getInstructionAssemblyString
+            self.proc_infos = target.getProcessorInfos()  # content of processor file
+            self.instructionXML = target.getInstructionXML()
             
             
             self.has_aligned_memory=  True
@@ -39,6 +48,8 @@ class Processor:
             # Blocked registers
             self._blocked_registers = []
             self._ignoreRegister = []  # Registers that should never be used or initialised automaitcly
+            self._registerAllocator = None
+            self._registerAllocatorOutdated = True  # blocked registers changed since the allocator was created
 
             # parse configurations from xml
             # Set register
@@ -79,6 +90,8 @@ class Processor:
                 self.immediate_operand = dict(self.proc_infos[IMMEDIATE_OPERAND])
             else:
                 self.immediate_operand = {}
+            self.immediatePool = None  # created on first use, if Constants.IMMEDIATE_POOL is set
+            self.immediatePrefixes = {}  # number format -> immediate operand format in front of the value
 
             if isinstance(self.proc_infos[SATURATION], dict):
                 self.saturation = dict(self.proc_infos[IMMEDIATE_OPERAND])
@@ -92,6 +105,13 @@ class Processor:
             self.maxBranchDistance = -1
             if MAX_BRANCH_DISTANCE in self.proc_infos:
                 self.maxBranchDistance = int(self.proc_infos[MAX_BRANCH_DISTANCE])
+            # pseudo instruction name: (machine instructions, immediate bits of the single instruction form)
+            self.pseudoInstructions = {}
+            if isinstance(self.proc_infos.get(PSEUDO_INSTRUCTIONS), dict):
+                for name, expansion in self.proc_infos[PSEUDO_INSTRUCTIONS].items():
+                    immediateBits = expansion.get(PSEUDO_INSTRUCTION_IMMEDIATE_BITS)
+                    self.pseudoInstructions[name.lower()] = (int(expansion[PSEUDO_INSTRUCTION_SIZE]),
+                                                             int(immediateBits) if immediateBits else None)
                 
             # start start address of processor state randomziation if available
             self.start_address_processor_state = 0 if PROCESSOR_START_ADDRESS_PROCESSOR_STATE not in self.proc_infos[PROCESSOR_MEMORY_ADDRESS_KEYWORD] else int(self.proc_infos[PROCESSOR_MEMORY_ADDRESS_KEYWORD][PROCESSOR_START_ADDRESS_PROCESSOR_STATE])
@@ -118,7 +138,7 @@ class Processor:
             if dataCache:
                 cache = self.dCacheSpec
 
-            prob = random.uniform(0, 1)
+            prob = GenerationContext.getRandom().uniform(0, 1)
             if prob < self.cacheMiss:
                 return int(cache[CACHE_BYTE_PER_LINE] * cache[CACHE_LINES])
             else:
@@ -139,7 +159,6 @@ class Processor:
         def setMemoryDescription(self):
             """Sets memory range and format description"""
             self.memory_description = {}
-            self.blockedMemoryAddresses = []  # Question: why here if blocked Memory is not used?
             key = PROCESSOR_MEMORY_ADDRESS_KEYWORD
             if isinstance(self.proc_infos[key], dict):
                 # get start and end addresses
@@ -157,12 +176,8 @@ class Processor:
                     if formating.value in self.proc_infos[key]:
                         value = self.__getKeyValue(self.proc_infos[key], formating.value)
                         self.memory_description[formating.value] = value
-
-        def fetch_xml_data(self, path: str):
-            file = open(path)
-            xml_content = xmltodict.parse(file.read())
-            file.close()
-            return xml_content
+            # blocked bytes of the dmem, the bitmap starts at the first dmem address
+            self.blockedMemory = MemoryAllocator(self.memory_description.get(MEMORY_DESCRIPTION.START_ADDRESS.value, 0))
 
         def blockHardRegister(self):
 
@@ -181,20 +196,15 @@ class Processor:
                                                  int(self.register[IGNORE_REGISTER][REGISTER][i])])
 
         def createRegisterStack(self):
-            """Create a new register stack with all possible registers and sets _registerStack. The list is shuffled randomly."""
-            max_reg_file = int(self.register[NUM_REG_FILES])
-            max_reg_size = int(self.register[REG_FILE_SIZE])
-
-            registerStack = []
-
-            for reg_file in range(max_reg_file):
-                for reg_size in range(max_reg_size):
-                    if [reg_file, reg_size] not in self._blocked_registers and [reg_file,
-                                                                                reg_size] not in self._ignoreRegister:
-                        registerStack.append([reg_file, reg_size])
-
-            shuffle(registerStack)
-            self._registerStack = registerStack
+            """Marks all registers, that are not blocked or ignored, as unused. The usable registers are only computed
+            on the first call or after the blocked registers changed."""
+            if self._registerAllocatorOutdated:
+                self._registerAllocator = RegisterAllocator(int(self.register[NUM_REG_FILES]),
+                                                            int(self.register[REG_FILE_SIZE]),
+                                                            self._blocked_registers + self._ignoreRegister)
+                self._registerAllocatorOutdated = False
+            else:
+                self._registerAllocator.reset()
 
         def getInstructionXML(self):
             return self.instructionXML
@@ -204,6 +214,13 @@ class Processor:
     _lock = Lock()
 
     def __init__(self, architecture="rv32imc", cacheMiss=0.0, newMemoryBlock=0.0):
+        context = GenerationContext.current()
+        if context is not None:
+            if context.processor is None:
+                context.processor = Processor.__processorParser(context.architecture, context.cacheMiss,
+                                                                context.newMemoryBlock)
+            self.instance = context.processor
+            return
         with self._lock:
             process_id = current_process().pid
             if process_id not in self._instances:
@@ -242,8 +259,10 @@ class Processor:
             instruction.lower()]  # instruction xml must have the same string with inst name, but lower case.
         if instruction is None:
             return self._getDefaultInstructionFeature(inst)
-        else:
-            return self.append_instr_feature(inst)
+        # the assembly table is built once per instruction and shared, do not modify it
+        if instruction.lower() not in self.instance.featureAssembly:
+            self.instance.featureAssembly[instruction.lower()] = self.append_instr_feature(inst)
+        return self.instance.featureAssembly[instruction.lower()]
 
     def _getDefaultInstructionFeature(self, inst):
         attr_dict = {}
@@ -306,37 +325,36 @@ class Processor:
         Returns:
             dict: Featueres with each possible attribute.
         """
-        # get instruction definition
-        instruction = instruction if instruction else INSTRUCTION_DEFAULT_MODES
-        instXML = self.instance.getInstructionXML()
-        if instruction.lower() not in instXML:
+        features = self.getInstructionFeatureNames(instruction)
+        if features is None:
             return {}
-        inst = instXML[instruction.lower()]  # instruction xml must have the same string with inst name, but lower case.
+        return dict(features)
 
-        attrDict = {}
-        for feature in INSTRUCTION_FEATURE_LIST + INSTRUCTION_SPECIAL_FEATURE:
-            if feature in inst and inst[feature] is not None:
-                attrDict[feature] = inst[feature].split(DELIMITER_FEATURE)
-            else:
-                attrDict[feature] = [None]
+    def getInstructionFeatureNames(self, instruction: str = None) -> Union[dict, None]:
+        """same as getAvailableInstructionFeaturesNames, but returns the shared feature table of the target with
+        tuples of attributes. Do not modify the returned dict.
+
+        Args:
+            instruction (str, optional): Name of the instruction. Defaults to None.
 
-        # change empty string to None
-        for attrList in attrDict.values():
-            for key, value in enumerate(attrList):
-                if value == '' or value == 'None':
-                    attrList[key] = None
-        return attrDict
+        Returns:
+            Union[dict, None]: Featueres with each possible attribute or None if the instruction is not defined.
+        """
+        # get instruction definition
+        instruction = instruction if instruction else INSTRUCTION_DEFAULT_MODES
+        # instruction xml must have the same string with inst name, but lower case.
+        return self.instance.target.getFeatureNames(instruction.lower())
 
     def random_enabled_features(self, instruction, immediateProbability=0.0, switchProbability=0.0) -> dict:
         """set features to be randomized or not"""
 
-        features = self.getAvailableInstructionFeaturesNames(instruction)
+        features = self.getInstructionFeatureNames(instruction) or {}
         feature_stats = {}
         for key in features:
-            feature_stats[key] = features[key][randint(0, len(features[key]) - 1)]
+            feature_stats[key] = features[key][GenerationContext.getRandom().randint(0, len(features[key]) - 1)]
         if IMMEDIATE in features:
-            if features[IMMEDIATE] != [None]:
-                rand_prob = round(uniform(0, 1), 3)
+            if features[IMMEDIATE] != (None,):
+                rand_prob = round(GenerationContext.getRandom().uniform(0, 1), 3)
                 # special handling of immediate Feature
                 if rand_prob <= immediateProbability or not (None in features[IMMEDIATE]):
                     feature_stats[IMMEDIATE] = features[IMMEDIATE][-1]
@@ -348,8 +366,8 @@ class Processor:
 
         # Switch Handling
         if SWITCH in features:
-            if features[SWITCH] != [None]:
-                rand_prob = round(uniform(0, 1), 3)
+            if features[SWITCH] != (None,):
+                rand_prob = round(GenerationContext.getRandom().uniform(0, 1), 3)
                 # only use if not immediate
                 if rand_prob <= switchProbability and ((IMMEDIATE in feature_stats and feature_stats[
                     IMMEDIATE] == None) or IMMEDIATE not in feature_stats):
@@ -362,7 +380,7 @@ class Processor:
 
         if CONDITIONAL in features:
             if len(features[CONDITIONAL]) > 1:
-                conditionSelected = randint(0, len(features[CONDITIONAL]) - 1)
+                conditionSelected = GenerationContext.getRandom().randint(0, len(features[CONDITIONAL]) - 1)
 
                 conditionValue = features[CONDITIONAL][conditionSelected]
 
@@ -375,7 +393,7 @@ class Processor:
                     # else:
                     #     conditionSelected = None
                 elif CONDITIONAL_READ == conditionValue:
-                    condition = randint(0, len(CONDITION_ELEMENTS) - 1)
+                    condition = GenerationContext.getRandom().randint(0, len(CONDITION_ELEMENTS) - 1)
                     feature_stats[CONDITIONAL_READ] = CONDITION_ELEMENTS[condition]
 
                 feature_stats[CONDITIONAL] = features[CONDITIONAL][conditionSelected]
@@ -385,10 +403,25 @@ class Processor:
         return feature_stats
 
     def getInstructionAssemblyString(self, name, enabledFeatures) -> str:
-        """Get Assembly format in XML then write all features enabled."""
-        # TODO: remove hard coded structure like ":" for issue slot
+        """Get Assembly format in XML then write all features enabled.
+        The mnemonic only depends on the name and the enabled features, so the least recently used
+        MNEMONIC_CACHE_SIZE rendered mnemonics are cached."""
         if not enabledFeatures:
             return name
+        key = (name, frozenset(enabledFeatures.items()))
+        mnemonics = self.instance.mnemonics
+        if key in mnemonics:
+            mnemonics.move_to_end(key)
+            return mnemonics[key]
+        if len(mnemonics) >= MNEMONIC_CACHE_SIZE:
+            # drop the least recently used entry
+            mnemonics.popitem(last=False)
+        mnemonic = self._renderInstructionAssemblyString(name, enabledFeatures)
+        mnemonics[key] = mnemonic
+        return mnemonic
+
+    def _renderInstructionAssemblyString(self, name, enabledFeatures) -> str:
+        # TODO: remove hard coded structure like ":" for issue slot
         returnString = ""
         tempdict = {}
         # Write all features
@@ -468,25 +501,28 @@ class Processor:
         return self.reg_format
 
     def create_immediate_operand(self, value: int = 0, type: str = FORMAT_DESCRIPTION.DEC.value) -> str:
-        # Make immediate operand
-        imm_rule = self.get_immediate_operand_rule()
-        imm_format = imm_rule[FORMAT]
-
-        # immediate type setting
-        if imm_rule[type] == None:
-            imm_type = ''
-        else:
-            imm_type = imm_rule[type]
-
         # convert value
         if type == FORMAT_DESCRIPTION.DEC.value:
             imm_value = str(value)
         else:
             imm_value = self.convert_number(value, type)
-        imm_format = imm_format.replace('_x_', str(imm_type))
-        imm_format = imm_format + imm_value
 
-        return imm_format
+        return Immediate(self._getImmediatePrefix(type) + imm_value, value)
+
+    def _getImmediatePrefix(self, type: str) -> str:
+        """returns the immediate operand format in front of the value for the given number format"""
+        if type not in self.instance.immediatePrefixes:
+            # Make immediate operand
+            imm_rule = self.get_immediate_operand_rule()
+            imm_format = imm_rule[FORMAT]
+
+            # immediate type setting
+            if imm_rule[type] == None:
+                imm_type = ''
+            else:
+                imm_type = imm_rule[type]
+            self.instance.immediatePrefixes[type] = imm_format.replace('_x_', str(imm_type))
+        return self.instance.immediatePrefixes[type]
 
     def convert_number(self, value: int = 0, type: str = FORMAT_DESCRIPTION.BIN.value) -> str:
         # value is always dec
@@ -511,6 +547,9 @@ class Processor:
         Returns:
             int: decimal integer of immediate
         """
+        if isinstance(immediate, Immediate):
+            return immediate.value
+
         # Make immediate operand
         immRule = self.get_immediate_operand_rule()
         immFormat = immRule[FORMAT]
@@ -530,7 +569,7 @@ class Processor:
             decInteger = int(immediate)
         if type == FORMAT_DESCRIPTION.HEX.value:
             decInteger = int(immediate, 16)
-        if type == FORMAT_DESCRIPTION.BIN:
+        if type == FORMAT_DESCRIPTION.BIN.value:
             decInteger = int(immediate, 2)
         return decInteger
 
@@ -556,29 +595,70 @@ class Processor:
     
     def _get_random_free_memory(self, enabledFeatures, start_addr, end_addr):
         aligned, factor = self._getAligned(enabledFeatures)
-        blocked_addr = set(self.instance.blockedMemoryAddresses)
-        range_addr = set(list(range(start_addr, end_addr+1, aligned)))
-        free_addr = list(range_addr - blocked_addr)
-        if len(free_addr) == 0:
-            raise Exception("There are no free addresses in the dmem left. Consider reducing the test complexity or increasing the dmem size!")
-        addr = random.choice(free_addr)
+        addr = self.instance.blockedMemory.getRandomFreeAddress(start_addr, end_addr, aligned)
+        if addr is None:
+            raise DataMemoryExhausted("There are no free addresses in the dmem left. Consider reducing the test complexity or increasing the dmem size!")
         # block address and handle alignment
         self._block_memory_addresses(addr)
         return addr
         
         
 
-    def _checkMemoryBlocked(self, address, aligned, factor, enabledFeatures=None):
-        blocked = False
+    def _getBlockedWindow(self, aligned, factor, enabledFeatures=None):
+        """returns the number of bytes starting at an address, that have to be free for a new memory address"""
         maxBlockedAddresses = aligned * factor
         if enabledFeatures:
             alignmed = int(enabledFeatures[ADDRESS_ALIGNMENT]) if enabledFeatures[ADDRESS_ALIGNMENT] else aligned
             maxBlockedAddresses = maxBlockedAddresses + alignmed + aligned + 4
-            # print(maxBlockedAddresses)
-        for i in range(maxBlockedAddresses):
-            if address + i in self.instance.blockedMemoryAddresses:
-                return True
-        return blocked
+        return maxBlockedAddresses
+
+    def _checkMemoryBlocked(self, address, aligned, factor, enabledFeatures=None):
+        return self.instance.blockedMemory.isBlocked(address, self._getBlockedWindow(aligned, factor, enabledFeatures))
+
+    def _findRandomMemoryAddress(self, start, end, aligned, factor, enabledFeatures):
+        """Draws a random unblocked address of range(start, end, aligned). After MEMORY_SEARCH_RETRIES failed draws,
+        the remaining free addresses are enumerated.
+
+        Raises:
+            DataMemoryExhausted: no free address is left
+        """
+        if start >= end:
+            raise DataMemoryExhausted("The dmem is exhausted, the code reaches the end of the dmem. Consider reducing the test complexity or increasing the dmem size!")
+        for retry in range(MEMORY_SEARCH_RETRIES):
+            address = GenerationContext.getRandom().randrange(start, end, aligned)
+            if not self._checkMemoryBlocked(address, aligned, factor, enabledFeatures):
+                return address
+
+        window = self._getBlockedWindow(aligned, factor, enabledFeatures)
+        candidates = self.instance.blockedMemory.getFreeAddresses(start, end, aligned, window)
+        if not candidates:
+            raise DataMemoryExhausted("The dmem is exhausted, there are no free addresses left. Consider reducing the test complexity or increasing the dmem size!")
+        return GenerationContext.getRandom().choice(candidates)
+
+    def _findRandomMemoryAddressPair(self, start, end, aligned, factor, enabledFeatures):
+        """Draws a random unblocked address of range(start, end, aligned) together with a free test address in the
+        next aligned memory block (see _findTestAddress). After MEMORY_SEARCH_RETRIES failed draws, the remaining free
+        pairs are enumerated.
+
+        Raises:
+            DataMemoryExhausted: no free pair of addresses is left
+        """
+        if start >= end:
+            raise DataMemoryExhausted("The dmem is exhausted, the code reaches the end of the dmem. Consider reducing the test complexity or increasing the dmem size!")
+        for retry in range(MEMORY_SEARCH_RETRIES):
+            address = GenerationContext.getRandom().randrange(start, end, aligned)
+            if not self._checkMemoryBlocked(address, aligned, factor, enabledFeatures):
+                testAddress = self._findTestAddress(address, enabledFeatures)
+                if testAddress is not None:
+                    return address, testAddress
+
+        window = self._getBlockedWindow(aligned, factor, enabledFeatures)
+        pairs = []
+        for address in self.instance.blockedMemory.getFreeAddresses(start, end, aligned, window):
+            pairs += [(address, testAddress) for testAddress in self._getFreeTestAddresses(address, enabledFeatures)]
+        if not pairs:
+            raise DataMemoryExhausted("The dmem is exhausted, there are no 2 consequitive free addresses left. Consider reducing the test complexity or increasing the dmem size!")
+        return GenerationContext.getRandom().choice(pairs)
 
     def _hasDCache(self):
         return len(self.instance.dCacheSpec) != 0
@@ -602,89 +682,105 @@ class Processor:
 
         return aligned, factor
 
-    def createRandomMemoryAddress(self, enabledFeatures=None, consequitive=False):
+    def _getEndAddress(self):
+        if MEMORY_DESCRIPTION.END_ADDRESS.value in self.instance.memory_description:
+            return self.instance.memory_description[MEMORY_DESCRIPTION.END_ADDRESS.value]
+        raise Exception("Please Set EndAddress in processor_{TARGET}.xml - Not doing so may corrupt the testprogram.")
 
-        start = self.instance.startAddress
+    def _getNextCachedMemoryAddress(self, end):
+        """returns the address behind the last blocked word for data cache tests or None, if it is behind the dmem"""
+        aligned, _ = self._getAligned(None)
+        # get address of last word
+        lastAddr = self.instance.blockedMemory.lastAddress
+        offset = lastAddr % aligned
+        lastWordAddress = lastAddr - offset
+        address = int(lastWordAddress + self.instance.getNextMemoryAddress(dataCache=True))
+        return address if address <= end else None
 
-        if MEMORY_DESCRIPTION.END_ADDRESS.value in self.instance.memory_description:
-            end = self.instance.memory_description[MEMORY_DESCRIPTION.END_ADDRESS.value]
-        else:
-            raise Exception("Please Set EndAddress in processor_{TARGET}.xml - Not doing so may corrupt the testprogram.")
+    def _useCachedMemoryAddress(self):
+        """returns True, if the next address continues the last memory block (data cache tests)"""
+        return self._hasDCache() and GenerationContext.getRandom().uniform(0, 1) >= self.instance.newMemoryBlock
 
+    def createRandomMemoryAddress(self, enabledFeatures=None):
 
+        start = self.instance.startAddress
+        end = self._getEndAddress()
         aligned, factor = self._getAligned(enabledFeatures)
 
-        if len(self.instance.blockedMemoryAddresses) == 0:
-            address = randrange(start, end, aligned)
+        if self.instance.blockedMemory.isEmpty():
+            address = self._findRandomMemoryAddress(start, end, aligned, factor, enabledFeatures)
+        elif not self._useCachedMemoryAddress():
+            address = self._get_random_free_memory(enabledFeatures, start, end)
         else:
+            address = self._getNextCachedMemoryAddress(end)
+            if address is None:
+                # new address is larger than data address range, generate a new random start address
+                address = self._findRandomMemoryAddress(start, end, aligned, factor, enabledFeatures)
 
-            if not self._hasDCache():
-                address = self._get_random_free_memory(enabledFeatures, start, end)
-            else:
-                prob = random.uniform(0, 1)
-                if prob < self.instance.newMemoryBlock:
-                    address = self._get_random_free_memory(enabledFeatures, start, end)
+        self._block_memory_addresses(address)
+        return address
 
-                else:
-                    # get address of last word
-                    lastAddr = self.instance.blockedMemoryAddresses[-1]
-                    offset = lastAddr % aligned
-                    lastWordAddress = lastAddr - offset
-                    address = int(lastWordAddress + self.instance.getNextMemoryAddress(dataCache=True))
-
-                    # check for consequitive addresses
-                    consequitiveNewSearch = False
-                    checkConsequitiveCondition = consequitive and enabledFeatures
-                    if checkConsequitiveCondition:
-                        consequitiveNewSearch = (-1 == self.snoopNextAlignedMemory(address,
-                                                                                   enabledFeatures))
-                    if address > end or consequitiveNewSearch:
-                        # new address is larger than data address range, generate a new random start address
-                        blocked = True
-                        while blocked:
-                            address = randrange(start, end, aligned)
-                            blocked = self._checkMemoryBlocked(address, aligned, factor, enabledFeatures)
-                            if not blocked and checkConsequitiveCondition:
-                                blocked = (-1 == self.snoopNextAlignedMemory(address, enabledFeatures))
+    def createRandomMemoryAddressPair(self, enabledFeatures):
+        """
+        Creates a random memory address and a test address in the next aligned memory block (for store halfword and
+        store byte). The address and the test address are chosen together, so they only fail if no free pair is left.
+        Both addresses are blocked.
+        :return: address, test address
+        Raises:
+            DataMemoryExhausted: no free pair of addresses is left
+        """
+        if not self.instance.has_aligned_memory:
+            address = self.createRandomMemoryAddress(enabledFeatures)
+            return address, self.createRandomMemoryAddress()
+
+        start = self.instance.startAddress
+        end = self._getEndAddress()
+        aligned, factor = self._getAligned(enabledFeatures)
 
+        pair = None
+        if not self.instance.blockedMemory.isEmpty() and self._useCachedMemoryAddress():
+            address = self._getNextCachedMemoryAddress(end)
+            if address is not None:
+                testAddress = self._findTestAddress(address, enabledFeatures)
+                if testAddress is not None:
+                    pair = address, testAddress
+        if pair is None:
+            pair = self._findRandomMemoryAddressPair(start, end, aligned, factor, enabledFeatures)
+
+        address, testAddress = pair
         self._block_memory_addresses(address)
-        return address
+        # always block full words (block other bytes of the word)
+        self.instance.blockedMemory.block(testAddress, aligned * factor)
+        return address, testAddress
 
     def _block_memory_addresses(self, address):
         alignment, _ = self._getAligned(None)
-        for i in range(alignment):
-            self.instance.blockedMemoryAddresses.append(address + i)
+        self.instance.blockedMemory.block(address, alignment)
         
 
-    def snoopNextAlignedMemory(self, address, enabledFeatures):
-        # chose TEST_ADDRESS in next aligned memory block depending on local alignment (for store halfword and store byte)
+    def _getTestAddressShifts(self, enabledFeatures):
+        """returns the offsets of the test address in the next aligned memory block, depending on the local alignment
+        (for store halfword and store byte)"""
         aligned = self.instance.memory_description[
             MEMORY_DESCRIPTION.ALIGNED.value] if MEMORY_DESCRIPTION.ALIGNED.value in self.instance.memory_description else 1
         alignmed = int(enabledFeatures[ADDRESS_ALIGNMENT]) if enabledFeatures[ADDRESS_ALIGNMENT] else aligned
-        shift = randrange(0, aligned, alignmed)
-        newAddress = address + aligned + shift
+        return range(0, aligned, alignmed)
 
+    def _getFreeTestAddresses(self, address, enabledFeatures) -> List[int]:
+        """returns the free test addresses in the aligned memory block after address"""
         aligned, factor = self._getAligned(enabledFeatures)
-        if self._checkMemoryBlocked(newAddress, aligned, factor):
-            return -1
-        return newAddress
-
-    def getNextAlignedMemoryAddress(self, address, enabledFeatures):
-       
-        if self.instance.has_aligned_memory:
-            newAddress = self.snoopNextAlignedMemory(address, enabledFeatures)
-            if newAddress == -1:
-                raise Exception("2 consequitive Addresses are not avaiable.")
-
-            aligned, factor = self._getAligned(enabledFeatures)
-            # block addresses
-            # always block full words (block other bytes of the word)
-            for i in range(aligned * factor):
-                self.instance.blockedMemoryAddresses.append(newAddress + i)
-        else:
-            newAddress = self.createRandomMemoryAddress()
+        testAddresses = [address + aligned + shift for shift in self._getTestAddressShifts(enabledFeatures)]
+        return [testAddress for testAddress in testAddresses if not self._checkMemoryBlocked(testAddress, aligned, factor)]
 
-        return newAddress
+    def _findTestAddress(self, address, enabledFeatures):
+        """returns a random free test address in the aligned memory block after address or None, if none is free"""
+        aligned, factor = self._getAligned(enabledFeatures)
+        shifts = self._getTestAddressShifts(enabledFeatures)
+        testAddress = address + aligned + shifts[GenerationContext.getRandom().randrange(len(shifts))]
+        if not self._checkMemoryBlocked(testAddress, aligned, factor):
+            return testAddress
+        freeTestAddresses = self._getFreeTestAddresses(address, enabledFeatures)
+        return GenerationContext.getRandom().choice(freeTestAddresses) if freeTestAddresses else None
 
     def generateRandomOperands(self, enabledFeatures: Dict[str, Union[str, None]], generateFocusRegister: bool = True,
                                FocusRegister: Union[str, None] = None, sequence: bool = False,
@@ -742,9 +838,8 @@ class Processor:
                                                                self.instance.immediateRegister[1])
                     continue
             elif key == OPERANDS.INIT_ADDRESS.value:
-                address = self.createRandomMemoryAddress(enabledFeatures, consequitive=True)
-                operands[key] = address
-                operands[OPERANDS.TEST_ADDRESS.value] = self.getNextAlignedMemoryAddress(address, enabledFeatures)
+                operands[key], operands[OPERANDS.TEST_ADDRESS.value] = self.createRandomMemoryAddressPair(
+                    enabledFeatures)
 
                 continue
             elif key == OPERANDS.TEST_ADDRESS.value:
@@ -777,14 +872,11 @@ class Processor:
     def generateRandomOperand(self, type, enabledFeatures, block=False):
         # If type is register do:
         if type == OPERAND_TYPE.REGISTER:
-            if len(self.instance._registerStack) > 0:
-                if block:
-                    useRegister = self.instance._registerStack.pop()
-                else:
-                    useRegister = self.instance._registerStack[randint(0, len(self.instance._registerStack) - 1)]
-                return self.createRegisterOperand(useRegister[0], useRegister[1])
+            if block:
+                useRegister = self.instance._registerAllocator.pop()
             else:
-                raise Exception("ERROR: Not enough register for all instructions")
+                useRegister = self.instance._registerAllocator.pick()
+            return self.createRegisterOperand(useRegister[0], useRegister[1])
 
         # If type is immediate do:
         elif type == OPERAND_TYPE.IMMEDIATE:
@@ -800,6 +892,55 @@ class Processor:
         n = 3
         pass
 
+    def compileOperandTemplate(self, operandString: str) -> tuple:
+        """Splits the operand string of an instruction into literal text and operand slots. Operands are matched in
+        the order of OPERANDS, equal to replacing them one after another. Ranged operands (i.e. randImmediate[31:12])
+        are stored with their pre-parsed range. Templates are compiled once per operand string.
+
+        Args:
+            operandString (str): the operands of the instruction as a string
+
+        Returns:
+            tuple: the template tokens (str for literal text, [operand, range, rangeString] for slots) and the
+                   information if randValue can be overwritten by the random immediate
+        """
+        if operandString in self.instance.operandTemplates:
+            return self.instance.operandTemplates[operandString]
+
+        tokens = [operandString]
+        for operand in OPERANDS:
+            keyword = operand.value
+            rangeable = keyword in [OPERANDS.RAND_VALUE.value, OPERANDS.RAND_IMMEDIATE.value, OPERANDS.ADDRESS.value]
+            pattern = re.escape(keyword)
+            if rangeable:
+                pattern += "(?:" + re.escape(IMM_RANGE.START.value) + "([^" + re.escape(IMM_RANGE.END.value) + "]*)" \
+                           + re.escape(IMM_RANGE.END.value) + ")?"
+            pattern = re.compile(pattern)
+            newTokens = []
+            for token in tokens:
+                if not isinstance(token, str):
+                    newTokens.append(token)
+                    continue
+                position = 0
+                for match in pattern.finditer(token):
+                    newTokens.append(token[position:match.start()])
+                    immRange = None
+                    rangeString = ""
+                    if rangeable and match.group(1) is not None:
+                        immRange = match.group(1).split(IMM_RANGE.SPLIT.value)
+                        rangeString = match.group(0)[len(keyword):]
+                    newTokens.append((keyword, immRange, rangeString))
+                    position = match.end()
+                newTokens.append(token[position:])
+            tokens = [token for token in newTokens if token != ""]
+
+        # randomValue is immediate instead of register
+        overwriteRandValue = not (OPERANDS.RAND_VALUE.value in operandString and
+                                  OPERANDS.RAND_IMMEDIATE.value in operandString)
+        template = (tuple(tokens), overwriteRandValue)
+        self.instance.operandTemplates[operandString] = template
+        return template
+
     def getOperandAssembly(self, operandString: str, operandAttributes: Dict[str, Union[str, int, None]],
                            overridingTargetRegister: Union[str, None] = None,
                            isRandValueRandomImmediate: bool = False) -> str:
@@ -814,45 +955,41 @@ class Processor:
         Returns:
             str: The operands of the instruction with operands replaced with values
         """
-        overwriteRandValue = True
-        # randomValue is immediate instead of register
-        if OPERANDS.RAND_VALUE.value in operandString and OPERANDS.RAND_IMMEDIATE.value in operandString:
-            overwriteRandValue = False
-            # operandString = operandString.replace(OPERANDS.RAND_VALUE.value, OPERANDS.RAND_IMMEDIATE.value)
+        tokens, overwriteRandValue = self.compileOperandTemplate(operandString)
+        assembly = []
+        for token in tokens:
+            if isinstance(token, str):
+                assembly.append(token)
+                continue
+            operand, immRange, rangeString = token
+            if operand not in operandAttributes:
+                # operands have not been set
+                assembly.append(operand + rangeString)
+                continue
 
-        for operand, value in operandAttributes.items():
+            value = operandAttributes[operand]
             if operand == OPERANDS.TARGET_REGISTER.value and overridingTargetRegister:
                 value = overridingTargetRegister
 
             # custom defined Immediates:
-            if (
-                    isRandValueRandomImmediate and operand == OPERANDS.RAND_VALUE.value) or operand == OPERANDS.RAND_IMMEDIATE.value:
-                if operand + IMM_RANGE.START.value in operandString:
-                    immRange = operandString[
-                               operandString.index(IMM_RANGE.START.value) + 1: operandString.index(IMM_RANGE.END.value)]
-                    operand = operand + IMM_RANGE.START.value + immRange + IMM_RANGE.END.value
-                    immRange = immRange.split(IMM_RANGE.SPLIT.value)
+            if (isRandValueRandomImmediate and operand == OPERANDS.RAND_VALUE.value) or operand == OPERANDS.RAND_IMMEDIATE.value:
+                if immRange:
                     value = self.getRangeImmediate(operandAttributes[OPERANDS.RAND_IMMEDIATE.value], immRange,
                                                    FORMAT_DESCRIPTION.HEX.value)
-                else:
-                    if OPERANDS.RAND_VALUE.value == operand and overwriteRandValue:
-                        # override random value with immediate
-                        value = operandAttributes[OPERANDS.RAND_IMMEDIATE.value]
-                    else:
-                        value = operandAttributes[operand]
+                    rangeString = ""
+                elif OPERANDS.RAND_VALUE.value == operand and overwriteRandValue:
+                    # override random value with immediate
+                    value = operandAttributes[OPERANDS.RAND_IMMEDIATE.value]
 
             # custom defined Address ranges
-            if operand == OPERANDS.ADDRESS.value and operand + IMM_RANGE.START.value in operandString:
-                immRange = operandString[
-                           operandString.index(IMM_RANGE.START.value) + 1: operandString.index(IMM_RANGE.END.value)]
-                operand = operand + IMM_RANGE.START.value + immRange + IMM_RANGE.END.value
-                immRange = immRange.split(IMM_RANGE.SPLIT.value)
+            if operand == OPERANDS.ADDRESS.value and immRange:
                 value = self.getRangeImmediate(operandAttributes[OPERANDS.ADDRESS.value], immRange,
                                                FORMAT_DESCRIPTION.DEC.value)
-            
-            operandString = operandString.replace(operand, str(value))
+                rangeString = ""
+
+            assembly.append(str(value) + rangeString)
 
-        return operandString
+        return "".join(assembly)
 
     def getRangeImmediate(self, immediate: str, immRange: List[str], type: str) -> str:
         """Creates a immediate in the given bit range from the given immediate.
@@ -865,16 +1002,15 @@ class Processor:
         Returns:
             str: the new immediate
         """
-        if type == FORMAT_DESCRIPTION.DEC.value:
+        if isinstance(immediate, Immediate):
+            decImm = immediate.value
+        elif type == FORMAT_DESCRIPTION.DEC.value:
             decImm = int(immediate)
         else:
             decImm = self.convertImmediateToDecInt(immediate, type)
-        binImm = str('{0:0' + str(int(immRange[0]) + 1) + 'b}').format(
-            decImm)  # binary value should always have enough bits
-        minRange = len(binImm) - int(immRange[0]) - 1
-        maxRange = (len(binImm) - int(immRange[1]))
-        binImm = binImm[minRange:maxRange]
-        decImm = int(binImm, 2)
+        highBit = int(immRange[0])
+        lowBit = int(immRange[1])
+        decImm = (decImm >> lowBit) & ((1 << (highBit - lowBit + 1)) - 1)
         return self.create_immediate_operand(decImm, type)
 
     def generateComparisonCode(self, instr_list: list, focusInstruction, targetInstruction, branchIndex=-1) -> str:
@@ -910,7 +1046,8 @@ class Processor:
         return '\n' + self.get_assembler_comment() + "global pre sequence code (TargetRegister = Focusregister for load as 1. sequence instruction)\n" + globalPrePlainCode
 
     def createUseRegister(self, maxRegFile, maxRegSize):
-        return [randint(0, maxRegFile), randint(0, maxRegSize)]
+        rng = GenerationContext.getRandom()
+        return [rng.randint(0, maxRegFile), rng.randint(0, maxRegSize)]
 
     def createRandImmediate(self, immediateName: str) -> str:
         """creates a random immediate with the processor definitions of the given immediate name.
@@ -924,16 +1061,17 @@ class Processor:
         if not immediateName:
             return
 
-        for attribute, assembly in self.instance.immediate.items():
-            if attribute == immediateName:
-                if attribute == DEFAULT:
-                    immType = self.getImmediateDefault()
-                else:
-                    immType = attribute
+        if immediateName not in self.instance.immediate:
+            raise Exception("ERROR: Unknown immediate type " + str(immediateName))
+        immType = self.getImmediateDefault() if immediateName == DEFAULT else immediateName
         # FIXME: immediate smaller than 0/min and max from processor description/ if signed/unsigned - don't set absolute value, but bit-length
         maxValue = int(self.get_immediate_operand_rule()[immType])
-        randValue = randint(0, maxValue)
         immBasis = FORMAT_DESCRIPTION.HEX.value
+        if Constants.IMMEDIATE_POOL:
+            if self.instance.immediatePool is None:
+                self.instance.immediatePool = ImmediatePool(self._getImmediatePrefix(immBasis))
+            return self.instance.immediatePool.get(maxValue)
+        randValue = GenerationContext.getRandom().randint(0, maxValue)
         immOperand = self.create_immediate_operand(randValue, immBasis)
         return immOperand
 
@@ -943,37 +1081,17 @@ class Processor:
         return immOperand
 
     def append_instr_feature(self, inst):
-        attr_dict = {}
-        for feature in INSTRUCTION_FEATURE_LIST:
-            if feature in inst:
-                attr_dict[feature] = inst[feature].split(DELIMITER_FEATURE) if inst[feature] is not None else [None]
-            else:
-                attr_dict[feature] = [None]
-
-        for feature in INSTRUCTION_SPECIAL_FEATURE:
-            if feature in inst:
-                attr_dict[feature] = inst[feature].split(DELIMITER_FEATURE) if inst[feature] is not None else [None]
-            else:
-                attr_dict[feature] = [None]
-
-        for attr_list in attr_dict.values():
-            for ind, value in enumerate(attr_list):
-                if value == '':
-                    attr_list[ind] = None
+        attr_dict = self.instance.target.instance.parseFeatureNames(inst)
 
         feature = {}
         # convert value to Assembly
         for key in attr_dict:
-            feature[key] = []
-            for value in attr_dict[key]:
-                if value == 'None' or value is None:
-                    feature[key].append(None)
-                else:
-                    feature[key].append(self.instance.proc_infos[key][value])
+            feature[key] = tuple(None if value is None else self.instance.proc_infos[key][value]
+                                 for value in attr_dict[key])
         return feature
 
     def getRandomIssueSlot(self):
-        return randint(0, int(self.instance.issue_slots[MAX_SIZE]));
+        return GenerationContext.getRandom().randint(0, int(self.instance.issue_slots[MAX_SIZE]));
 
     def getIgnoreRegister(self) -> List[List[int]]:
         """returns the list of registers to be ignored of the processor
@@ -989,7 +1107,31 @@ class Processor:
         Returns:
             List[List[int]]: List of registers as lists with registerfile and register as int
         """
-        return self.instance._registerStack
+        return self.instance._registerAllocator.getFreeRegisters()
+
+    def releaseRegister(self, register: List[int]):
+        """marks a register, that was taken with block=True, as unused again
+
+        Args:
+            register (List[int]): register as list with registerfile and register as int
+        """
+        self.instance._registerAllocator.release(register)
+
+    def getRegisterStackMark(self) -> int:
+        """returns a mark of the registers taken with block=True so far, see releaseRegistersSince
+
+        Returns:
+            int: mark to pass to releaseRegistersSince
+        """
+        return self.instance._registerAllocator.mark()
+
+    def releaseRegistersSince(self, mark: int):
+        """marks all registers taken with block=True after getRegisterStackMark returned mark as unused again
+
+        Args:
+            mark (int): mark returned by getRegisterStackMark
+        """
+        self.instance._registerAllocator.releaseSince(mark)
 
     def getSIMD(self):
         return self.instance.proc_infos[SIMD]
@@ -1004,7 +1146,6 @@ class Processor:
         self.instance.createRegisterStack()
         self.resetBranchIndex()
         self.instance.setMemoryDescription()
-        self.instance.blockedMemoryAddresses = []
         self.instance.startAddress = -1
 
     def setStartAddress(self, startAddress):
@@ -1075,6 +1216,59 @@ class Processor:
     def hasIMemJump(self):
         return bool(self.instance.iCacheSpec)
 
+    def getIMemSize(self) -> int:
+        """returns the number of machine instructions, that fit into the imem. 0 if the processor does not specify it."""
+        return self.instance.memory_description.get(MEMORY_DESCRIPTION.IMEM_SIZE.value, 0)
+
+    def getAssemblyLabels(self, code: str) -> List[str]:
+        """returns the names of the labels defined in assembly code, in the order of their definition. Empty if the
+        processor has no branch target labels."""
+        label = self.getBranchTargetLabel()
+        if not label:
+            return []
+        comment = self.get_assembler_comment()
+        definition = re.compile(r"\s*([A-Za-z_.$][\w.$]*)" + re.escape(label))
+        labels = []
+        for line in code.splitlines():
+            match = definition.match(line.split(comment)[0])
+            if match:
+                labels.append(match.group(1))
+        return labels
+
+    def countAssemblyInstructions(self, code: str) -> int:
+        """counts the machine instructions of assembly code. Lines, that are empty, a comment, a directive or a label,
+        are not counted. A pseudo instruction of the processor counts with its size, every other line is one machine
+        instruction."""
+        comment = self.get_assembler_comment()
+        label = self.getBranchTargetLabel()
+        count = 0
+        for line in code.splitlines():
+            line = line.strip()
+            if not line or line.startswith(comment) or line.startswith("."):
+                continue
+            line = line.split(comment)[0].strip()
+            if label and line.endswith(label):
+                continue
+            count += self._countMachineInstructions(line)
+        return count
+
+    def _countMachineInstructions(self, line: str) -> int:
+        """returns the number of machine instructions of one line of assembly code"""
+        operation, *operands = line.split(None, 1)
+        if operation.lower() not in self.instance.pseudoInstructions:
+            return 1
+        size, immediateBits = self.instance.pseudoInstructions[operation.lower()]
+        if immediateBits is None or not operands:
+            return size
+        try:
+            immediate = int(operands[0].split(",")[-1].strip(), 0)
+        except ValueError:
+            # symbols are resolved by the assembler
+            return size
+        if -2 ** (immediateBits - 1) <= immediate < 2 ** (immediateBits - 1):
+            return 1
+        return size
+
     def get_delimiter_list(self):
         return [ x for x in list(self.instance.assembly_structure.values()) if x is not None]
     
@@ -1108,6 +1302,7 @@ class Processor:
     
     def set_block_register(self, register):
         self.instance._blocked_registers.append(register)
+        self.instance._registerAllocatorOutdated = True
     
     def get_block_register(self):
         return self.instance._blocked_registers
\ No newline at end of file
@@ -0,0 +1,95 @@
+# Copyright (c) 2022 Chair for Chip Design for Embedded Computing,
+#                    Technische Universitaet Braunschweig, Germany
+#                    www.tu-braunschweig.de/en/eis
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT
+
+from typing import List
+
+from util.GenerationContext import GenerationContext
+
+
+class RegisterFileExhausted(Exception):
+    """Raised if all usable registers are in use"""
+
+
+class RegisterAllocator:
+    """Registers of the processor, that are not used by the current test.
+
+    Registers are numbered register file * registers per file + register. The usable registers (not blocked or
+    ignored) are stored as an integer bitmask and computed once. The free registers are kept in a list with the
+    position of each register, so picking, popping and releasing a register takes constant time.
+    Popped registers are logged, so all registers taken after a mark can be released together.
+    """
+
+    def __init__(self, registerFiles: int, registersPerFile: int, excludedRegisters: List[List[int]]):
+        self.registersPerFile = registersPerFile
+        self.usableMask = (1 << (registerFiles * registersPerFile)) - 1
+        for registerFile, register in excludedRegisters:
+            if 0 <= registerFile < registerFiles and 0 <= register < registersPerFile:
+                self.usableMask &= ~(1 << self._toIndex(registerFile, register))
+        self._usable = [index for index in range(registerFiles * registersPerFile) if self.usableMask >> index & 1]
+        self._usablePositions = [-1] * (registerFiles * registersPerFile)
+        for position, index in enumerate(self._usable):
+            self._usablePositions[index] = position
+        self.reset()
+
+    def _toIndex(self, registerFile: int, register: int) -> int:
+        return registerFile * self.registersPerFile + register
+
+    def _toRegister(self, index: int) -> List[int]:
+        return [index // self.registersPerFile, index % self.registersPerFile]
+
+    def reset(self):
+        """marks all usable registers as free"""
+        self._free = list(self._usable)
+        self._positions = list(self._usablePositions)
+        self._taken = []
+
+    def __len__(self) -> int:
+        return len(self._free)
+
+    def pick(self) -> List[int]:
+        """returns a random free register, the register stays free"""
+        if not self._free:
+            raise RegisterFileExhausted("ERROR: Not enough register for all instructions")
+        return self._toRegister(self._free[GenerationContext.getRandom().randrange(len(self._free))])
+
+    def pop(self) -> List[int]:
+        """returns a random free register and marks it as used"""
+        if not self._free:
+            raise RegisterFileExhausted("ERROR: Not enough register for all instructions")
+        position = GenerationContext.getRandom().randrange(len(self._free))
+        index = self._free[position]
+        last = self._free.pop()
+        if last != index:
+            self._free[position] = last
+            self._positions[last] = position
+        self._positions[index] = -1
+        self._taken.append(index)
+        return self._toRegister(index)
+
+    def release(self, register: List[int]):
+        """marks a used register as free again"""
+        index = self._toIndex(register[0], register[1])
+        if self.usableMask >> index & 1 and self._positions[index] == -1:
+            self._positions[index] = len(self._free)
+            self._free.append(index)
+
+    def mark(self) -> int:
+        """returns a mark for releaseSince"""
+        return len(self._taken)
+
+    def releaseSince(self, mark: int):
+        """marks all registers popped after mark was taken as free again"""
+        for index in self._taken[mark:]:
+            self.release(self._toRegister(index))
+        del self._taken[mark:]
+
+    def isFree(self, register: List[int]) -> bool:
+        return self._positions[self._toIndex(register[0], register[1])] != -1
+
+    def getFreeRegisters(self) -> List[List[int]]:
+        return [self._toRegister(index) for index in self._free]
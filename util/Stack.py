@@ -6,18 +6,23 @@
 # license that can be found in the LICENSE file or at
 # https://opensource.org/licenses/MIT
 
-import copy  # for deepcopy
-import itertools
+import bisect
 import pickle
-import random
+import sys
+import warnings
 from typing import Dict, List
 
 from Constants import *
 import Constants
+from util.AssemblyBuffer import AssemblyBuffer
 from util.DataBank import DataBank
+from util.GenerationContext import GenerationContext
+from util.MemoryAllocator import DataMemoryExhausted
 from util.Processor import Processor
+from util.RegisterAllocator import RegisterFileExhausted
 from util.RandomOptions import RandomOptions
 from util.TestInstruction import TestInstruction
+from util.TestInstructionLog import TestInstructionLog
 
 
 class Stack:
@@ -32,35 +37,40 @@ class Stack:
         self.icacheMissChance = float(icacheMissChance)
         self._restore_operands = None
         self.need_random_block_memory = DataBank().need_random_block_register()
+        self._sequenceIndex = None  # sequence test instructions by type, see _getSequenceIndex
+        self._featureCombinations = {}  # feature combinations of the basic and complete tests, see _getFeatureCombinations
 
-    def generateInstructionsList(self, level: int, singleInstruction="", max_instructions=-1):
-        self._instructionsList = []
+    def generateInstructionsList(self, level: int, singleInstruction="", max_instructions=-1, bounded_memory=False):
+        self._instructionsList = TestInstructionLog() if bounded_memory else []
         if singleInstruction != "":
             for testInstruction in self._TestInstructions:
                 if testInstruction.getInstruction().upper() == singleInstruction.upper():
-                    self._instructionsList.append(copy.deepcopy(testInstruction))
+                    self._instructionsList.append(testInstruction.clone())
                     return
-        for i in range(level):
-            # deep copy elements, because in the instructionlist they are changed.
-            # This should not affect all occurences inside the instructionslist
-            self._instructionsList.extend(copy.deepcopy(self._TestInstructions))
-        random.shuffle(self._instructionsList)
-        
-        if max_instructions > 0:
-            self._instructionsList = self._instructionsList[:max_instructions]
-        
-        if self._instructionsList[0].getInstruction() == NOP_INSTR:
-            nopInstr = self._instructionsList[0]
-            for index in range(len(self._instructionsList)):
-                testInstr = self._instructionsList[index]
-                if testInstr.getInstruction() != NOP_INSTR:
+        # select the test instructions by index, only the selected elements are copied
+        templateCount = len(self._TestInstructions)
+        if 0 < max_instructions < level * templateCount:
+            # same distribution as shuffling all levels and truncating.
+            # Index i of the repeated list is the test instruction i % templateCount
+            drawn = GenerationContext.getRandom().sample(range(level * templateCount), max_instructions)
+            indices = [index % templateCount for index in drawn]
+        else:
+            indices = list(range(templateCount)) * level
+            GenerationContext.getRandom().shuffle(indices)
+
+        if self._TestInstructions[indices[0]].getInstruction() == NOP_INSTR:
+            for index in range(len(indices)):
+                if self._TestInstructions[indices[index]].getInstruction() != NOP_INSTR:
                     break;
-            noNopInstr = self._instructionsList[index]
-            self._instructionsList[0] = noNopInstr
-            self._instructionsList[index] = nopInstr
+            indices[0], indices[index] = indices[index], indices[0]
+
+        for index in indices:
+            # copy elements, because in the instructionlist they are changed.
+            # This should not affect all occurences inside the instructionslist
+            self._instructionsList.append(self._TestInstructions[index].clone())
 
     def _checkImemCacheMissOpportunities(self, instructionList, outsideSequenceUsage=False):
-        prob = random.uniform(0, 1)
+        prob = GenerationContext.getRandom().uniform(0, 1)
         if prob < self.icacheMissChance:
             # get IcacheJumpInstructions
 
@@ -81,102 +91,191 @@ class Stack:
                         break
             self._sanitizeBranches(instructionList)
 
-    def generateSequenceInstructionsList(self, sequenceLength=4):
-        instructions = {}
-        # first instruction cannot be nop
-        noNopInstructions = {}
-        for testInstruction in self._TestInstructions:
-            if testInstruction.hasValidSequenceInstruction():
-                type = testInstruction.getType()
-                if type not in instructions:
-                    instructions[type] = []
-                    noNopInstructions[type] = []
-                instructions[type].append(copy.deepcopy(testInstruction))
-                # first instruction cannot be nop
-                if testInstruction.getInstruction() != NOP_INSTR:
-                    noNopInstructions[type].append(copy.deepcopy(testInstruction))
-
-        diffInstrTypes = instructions.keys()
-        instructionsList = []
-        results = itertools.product(list(diffInstrTypes), repeat=sequenceLength)
-        for combination in results:
+    def _getSequenceInstructionTypes(self):
+        """returns the test instructions, that can be used in sequences, by type. The second dict does not contain
+        nop, since the first instruction of a sequence cannot be nop."""
+        instructions, noNopInstructions, _ = self._getSequenceIndex()
+        return instructions, noNopInstructions
+
+    def _getSequenceIndex(self):
+        """
+        Sorts the test instructions, that can be used in sequences, by type. The index is built on first use.
+        :return: test instructions by type, test instructions without nop by type and the multi cycle types. The
+        multi cycle types contain each type once per test instruction, so stalls are weighted by instructions.
+        """
+        if self._sequenceIndex is None:
+            instructions = {}
+            # first instruction cannot be nop
+            noNopInstructions = {}
+            # stall Instructions
+            stallTypes = []
+            for testInstruction in self._TestInstructions:
+                if testInstruction.hasValidSequenceInstruction():
+                    type = testInstruction.getType()
+                    if type not in instructions:
+                        instructions[type] = []
+                        noNopInstructions[type] = []
+                    if MULTI_CYCLE_INSTRUCTION_TYPE in type:
+                        stallTypes.append(type)
+                    instructions[type].append(testInstruction)
+                    # first instruction cannot be nop
+                    if testInstruction.getInstruction() != NOP_INSTR:
+                        noNopInstructions[type].append(testInstruction)
+            self._sequenceIndex = instructions, noNopInstructions, stallTypes
+        return self._sequenceIndex
+
+    def getSequenceCombinationCount(self, sequenceLength=4) -> int:
+        """returns the number of instruction type combinations of sequences with the given length"""
+        instructions, _ = self._getSequenceInstructionTypes()
+        return len(instructions) ** int(sequenceLength)
+
+    def generateSequenceInstructionsList(self, sequenceLength=4, combinations=None):
+        """
+        Creates a sequence for each combination of instruction types. The sequences are created lazily, one
+        combination at a time.
+        :param sequenceLength: number of instructions of each sequence
+        :param combinations: indices of the combinations to create, combinations are numbered in the order of
+        itertools.product. Defaults to all combinations.
+        :return: iterator of the sequences (lists of test instructions) of the combinations
+        """
+        instructions, noNopInstructions = self._getSequenceInstructionTypes()
+        diffInstrTypes = list(instructions.keys())
+        sequenceLength = int(sequenceLength)
+        if combinations is None:
+            combinations = range(len(diffInstrTypes) ** sequenceLength)
+        return self._iterateSequences(instructions, noNopInstructions, diffInstrTypes, sequenceLength, combinations)
+
+    def sampleSequenceCombinations(self, sequenceLength, samples, stratified=False) -> List[int]:
+        """
+        Draws combinations of instruction types for sequences without enumerating all combinations.
+        :param sequenceLength: number of instructions of each sequence
+        :param samples: number of combinations to draw. If there are not more combinations, all are returned.
+        :param stratified: if True, each type occurs equally often (+-1) at each position of the sequences, else the
+        combinations are drawn uniformly. Combinations drawn twice are only returned once.
+        :return: sorted indices of the drawn combinations (see generateSequenceInstructionsList)
+        """
+        instructions, _ = self._getSequenceInstructionTypes()
+        typeCount = len(instructions)
+        sequenceLength = int(sequenceLength)
+        combinationCount = typeCount ** sequenceLength
+        if samples >= combinationCount:
+            return list(range(combinationCount))
+
+        if stratified:
+            drawn = [0] * samples
+            for _ in range(sequenceLength):
+                # each type once per typeCount samples, the rest of the types in random order
+                typeOrder = GenerationContext.getRandom().sample(range(typeCount), typeCount)
+                column = [typeOrder[sample % typeCount] for sample in range(samples)]
+                GenerationContext.getRandom().shuffle(column)
+                drawn = [combinationIndex * typeCount + typeIndex for combinationIndex, typeIndex in zip(drawn, column)]
+            return sorted(set(drawn))
+
+        if combinationCount <= sys.maxsize:
+            return sorted(GenerationContext.getRandom().sample(range(combinationCount), samples))
+        drawn = set()
+        while len(drawn) < samples:
+            drawn.add(GenerationContext.getRandom().randrange(combinationCount))
+        return sorted(drawn)
+
+    def _iterateSequences(self, instructions, noNopInstructions, diffInstrTypes, sequenceLength, combinations):
+        for combinationIndex in combinations:
+            # the digits of the index in base len(diffInstrTypes) are the types, the first type is the highest digit
+            combination = []
+            for _ in range(sequenceLength):
+                combinationIndex, typeIndex = divmod(combinationIndex, len(diffInstrTypes))
+                combination.append(diffInstrTypes[typeIndex])
+            combination.reverse()
+
             temp = []
-            listKeys = []
             for index in range(len(combination)):
                 key = combination[index]
-                listKeys.append(key)
                 instrList = instructions
                 if index == 0:
                     instrList = noNopInstructions
-                temp.append(copy.deepcopy(random.choice(instrList[key])))
+                temp.append(GenerationContext.getRandom().choice(instrList[key]).clone())
+            yield temp
 
-            instructionsList.append(temp)
-        print(len(instructionsList))
-        return instructionsList
-
-    def _getSequenceKey(self, instructionTypes, stallTypes, forwardingStallProb):
-        key = list(instructionTypes.keys())[0]
-        prob = random.uniform(0, 1)
+    def _getSequenceKey(self, firstType, stallTypes, forwardingStallProb):
+        key = firstType
+        prob = GenerationContext.getRandom().uniform(0, 1)
         if prob <= forwardingStallProb and len(stallTypes) > 0:
-            key = random.choice(stallTypes)
+            key = GenerationContext.getRandom().choice(stallTypes)
         return key
 
     def generateSingleSequence(self, length, forwardingStallProb=0.0):
         """
         :return: Returns a list of R-type instructions to interrupt a Sequence
         """
-        instructions = {}
-        # first instruction cannot be nop
-        noNopInstructions = {}
-        # stall Instructions
-        stallTypes = []
-        for testInstruction in self._TestInstructions:
-            if testInstruction.hasValidSequenceInstruction():
-                type = testInstruction.getType()
-                if type not in instructions:
-                    instructions[type] = []
-                    noNopInstructions[type] = []
-                if MULTI_CYCLE_INSTRUCTION_TYPE in type:
-                    stallTypes.append(type)
-
-                instructions[type].append(copy.deepcopy(testInstruction))
-                # first instruction cannot be nop
-                if testInstruction.getInstruction() != NOP_INSTR:
-                    noNopInstructions[type].append(copy.deepcopy(testInstruction))
+        instructions, noNopInstructions, stallTypes = self._getSequenceIndex()
+        firstType = next(iter(noNopInstructions))
 
         temp = []
-        key = self._getSequenceKey(noNopInstructions, stallTypes, forwardingStallProb)
-        temp.append(copy.deepcopy(random.choice(noNopInstructions[key])))
+        key = self._getSequenceKey(firstType, stallTypes, forwardingStallProb)
+        temp.append(GenerationContext.getRandom().choice(noNopInstructions[key]).clone())
         for i in range(length - 1):
-            key = self._getSequenceKey(noNopInstructions, stallTypes, forwardingStallProb)
-            temp.append(copy.deepcopy(random.choice(instructions[key])))
+            key = self._getSequenceKey(firstType, stallTypes, forwardingStallProb)
+            temp.append(GenerationContext.getRandom().choice(instructions[key]).clone())
         return temp
 
     def _chainInstructions(self, testInstructions: List[TestInstruction], switchProbability=0.0, sequence=False,
-                           blockRandomRegister=False):
+                           blockRandomRegister=False, truncateOnExhaustion=False, segmentLimits=None):
         """
         Set Register chain of Focus and Target register.
         :param testInstructions: List of instruction to chain together
         :param switchProbability: 0 to 1.0. probability of an instruction switching the position of Focus and random operand.
+        :param truncateOnExhaustion: if the dmem is exhausted, end the chain early and remove the remaining instructions
+        from testInstructions.
+        :param segmentLimits: sorted indices at which the code of testInstructions is split into segments (see
+        generateCodeFull). If given, the registers blocked by a segment are released, once its reverse code is done, and
+        a new segment is inserted into segmentLimits, if the registers run out.
         """
         focus_register = None
         sequenceFocusRegister = None
-        i = 0
-        for testInstruction in testInstructions:
+        limits = set(segmentLimits) if segmentLimits is not None else set()
+        segmentStart = 0
+        # registers of the first instruction are used by the comparison code, they are never released
+        segmentMark = None
+        # elements are written back, testInstructions can be a TestInstructionLog
+        for i, testInstruction in enumerate(testInstructions):
+            if segmentMark is not None and i in limits:
+                Processor().releaseRegistersSince(segmentMark)
+                segmentStart = i
 
-            testInstruction.generateRandomOperands(focusRegister=focus_register, sequence=sequence,
-                                                   sequenceFocusRegister=sequenceFocusRegister,
-                                                   blockRandomRegister=blockRandomRegister)
+            try:
+                while True:
+                    try:
+                        testInstruction.generateRandomOperands(focusRegister=focus_register, sequence=sequence,
+                                                               sequenceFocusRegister=sequenceFocusRegister,
+                                                               blockRandomRegister=blockRandomRegister)
+                        break
+                    except RegisterFileExhausted:
+                        if segmentMark is None or i == segmentStart:
+                            raise
+                        # end the segment before this instruction, the registers of the segment are free after its
+                        # reverse code
+                        Processor().releaseRegistersSince(segmentMark)
+                        bisect.insort(segmentLimits, i)
+                        segmentStart = i
+            except DataMemoryExhausted as e:
+                if not truncateOnExhaustion or i == 0:
+                    raise
+                warnings.warn(f"{e} The test ends after {i} of {len(testInstructions)} test instructions.")
+                del testInstructions[i:]
+                break
+            if i == 0 and segmentLimits is not None:
+                segmentMark = Processor().getRegisterStackMark()
             # should only be necessary on first testInstruciton, since Fosuc_register doesnt change
             focus_register = testInstruction.getTargetOperand()
             if testInstruction.hasNewSequenceTargetReg():
                 sequenceFocusRegister = testInstruction.getNewSequenceTargetOperand()
             else:
                 sequenceFocusRegister = testInstruction.getSequenceTargetOperand()
-            i += 1
+            testInstructions[i] = testInstruction
 
-        for testInstruction in testInstructions:
+        for i, testInstruction in enumerate(testInstructions):
             testInstruction.setTargetRegister(focus_register)
+            testInstructions[i] = testInstruction
 
     def randomizeInstructionListFeatures(self, immediateProbability=0.0, switchProbability=0.0):
         for testInstruction in self._instructionsList:
@@ -185,24 +284,30 @@ class Stack:
             # testInstruction.setEnableFeature(CONDITIONAL, "CRS")
 
     def _generateModCode(self, instructions: List[TestInstruction], sequenceDebugInfo=-1, interleaving=False):
-        code = ""
-        interleaving_instr = DataBank().get_pre_random_to_memory() if interleaving else []
+        code = AssemblyBuffer()
+        interleaving_instr = DataBank().get_pre_random_to_memory() if interleaving and not self.need_random_block_memory else []
         for i, instr in enumerate(instructions):
             code += instr.generateModificationCode(i, interleaving_instr)
             code += Processor().get_assembler_comment() +"new MOD starting\n"
+            instructions[i] = instr
         return code
 
     def _generateReverseCode(self, instructions: List[TestInstruction], sequenceDebugInfo=-1, interleaving=False):
-        code = ""
-        interleaving_instr = DataBank().get_post_random_to_memory() if interleaving else []
+        code = AssemblyBuffer()
+        interleaving_instr = DataBank().get_post_random_to_memory() if interleaving and not self.need_random_block_memory else []
         counter = len(instructions) - 1
         for instr in reversed(instructions):
             code += instr.generateReversiCode(counter, interleaving_instr)
+            instructions[counter] = instr
             counter -=1
         return code
 
-    def generateCodeFull(self, interleaving=False):
+    def generateCodeFull(self, interleaving=False, specialImmediateCode=None):
+        """Generates the code of the instruction list in segments, that are split at the branch limits.
+        specialImmediateCode (see _generateSpecialImmediateCode) is emitted at the start of the segment of its
+        instruction, because the registers of a segment can be reused by later segments."""
         sequences: List[TestInstruction] = [self._instructionsList]
+        starts = [0]
         if len(self._BranchLimits) > 0:
             sequences = []
             previousIndex = 0
@@ -210,11 +315,15 @@ class Stack:
                 temp = self._instructionsList[previousIndex:index]
                 sequences.append(temp)
                 previousIndex = index
-            sequences.append(self._instructionsList[previousIndex:-1])
+                starts.append(index)
+            sequences.append(self._instructionsList[previousIndex:])
 
-        code = ''
+        code = AssemblyBuffer()
         for i in range(len(sequences)):
             sequence: List[TestInstruction] = sequences[i]
+            if specialImmediateCode:
+                for index in range(starts[i], starts[i] + len(sequence)):
+                    code += specialImmediateCode.get(index, "")
             try:
                 code += "\n" + Processor().get_assembler_comment() + "Starting Sequence " + str(i) + "\n"
                 # generate Code
@@ -225,7 +334,7 @@ class Stack:
             except Exception as e:
                 # dump sequence 
                 with open("interleaving_branch_bug", "wb") as fd:
-                    pickle.dump(sequence, fd)
+                    pickle.dump(list(sequence), fd)
                 raise Exception(e)
 
         # generate comparison code
@@ -257,22 +366,25 @@ class Stack:
 
     def _createInterleavingInstructions(self, level: int = 1, immediateProbability=0.0, switchProbability=0.0,
                                         specialImmediates=0.0, max_instructions=-1):
-        self.generateInstructionsList(level, max_instructions=max_instructions)
+        self.generateInstructionsList(level, max_instructions=max_instructions,
+                                      bounded_memory=Constants.BOUNDED_MEMORY)
         self._setRandomFeatures(self._instructionsList, immediateProbability, switchProbability)
         self._sanitizeBranches(self._instructionsList)
         if Processor()._hasICache():
             self._checkImemCacheMissOpportunities(self._instructionsList, outsideSequenceUsage=True)
 
-        code = ""
+        code = AssemblyBuffer()
         code += Processor().calculateStartAddress(self._instructionsList)
-        self._chainInstructions(self._instructionsList, switchProbability, blockRandomRegister=self.need_random_block_memory)
+        self._chainInstructions(self._instructionsList, switchProbability, blockRandomRegister=self.need_random_block_memory,
+                                truncateOnExhaustion=True, segmentLimits=self._BranchLimits)
+        # the list might have been truncated
+        self._BranchLimits = [index for index in self._BranchLimits if index < len(self._instructionsList)]
 
         instructionCount = 0
         c, i = self._generateSpecialImmediateCode(self._instructionsList, specialImmediates)
-        code += c
         instructionCount += i
 
-        code += self.generateCodeFull(interleaving=True)
+        code += self.generateCodeFull(interleaving=True, specialImmediateCode=c)
         instructionCount += self.getTotalInstructions(self._instructionsList)
 
         testInstructions = len(self._instructionsList)
@@ -282,8 +394,9 @@ class Stack:
         return code, testInstructions, instructionCount
 
     def _setRandomFeatures(self, testInstructions: List[TestInstruction], immediateProbability, switchProbability):
-        for instr in testInstructions:
+        for i, instr in enumerate(testInstructions):
             instr.set_random_features(immediateProbability, switchProbability)
+            testInstructions[i] = instr
 
     def _generateCodeSequence(self, instructionList: List[TestInstruction], forwarding, immediateProbability=0.0,
                               switchProbability=0.0, specialImmediates=0.0, forwardingStallProb=0.0):
@@ -293,7 +406,7 @@ class Stack:
             sequence = self.generateSingleSequence(len(instructionList) * forwarding,
                                                    forwardingStallProb=forwardingStallProb)
 
-        code = ""
+        code = AssemblyBuffer()
 
         # set random features
         self._setRandomFeatures(instructionList, immediateProbability, switchProbability)
@@ -310,7 +423,7 @@ class Stack:
 
         instructionCount = 0
         c, i = self._generateSpecialImmediateCode(instructionList, specialImmediates)
-        code += c
+        code += "".join(c.values())
         instructionCount += i
 
         code += self._generateModCode(instructionList)
@@ -388,15 +501,17 @@ class Stack:
         return instrCount
 
     def _generateSpecialImmediateCode(self, instructionList, specialImmediates):
-        code = ""
+        """returns the code, that loads a special immediate into the source registers, for each index of
+        instructionList with special immediates and the number of instructions of the code"""
+        code = {}
         instrCount = 0
-        randValue = random.uniform(0, 1)
+        randValue = GenerationContext.getRandom().uniform(0, 1)
         if randValue < specialImmediates:
-            for instr in instructionList:
+            for index, instr in enumerate(instructionList):
                 if instr.hasSpecialImmediates():
                     c, i = DataBank().getFixedImmediateCode(instr.getOperands(), Processor().convertInt2Assembly(
-                        random.choice(instr.getSpecialImmediates())))
-                    code += c
+                        GenerationContext.getRandom().choice(instr.getSpecialImmediates())))
+                    code[index] = c
                     instrCount += i
         return code, instrCount
 
@@ -421,15 +536,16 @@ class Stack:
                     instructionCount = instr.calculateEnabledInstructions()
 
     def reset(self):
+        if isinstance(self._instructionsList, TestInstructionLog):
+            self._instructionsList.close()
         self._instructionsList = []
         self._BranchLimits = []
 
     def createInterleavingInstructions(self, random_ops, level: int = 1, immediateProbability=0.0, switchProbability=0.0,
                                        specialImmediates=0.0, max_instructions=-1):
+        code = AssemblyBuffer()
         if random_ops.has_init_reg_file():
-            code = DataBank().assemblyRandomizeRegisterFile(randomize_immediate=random_ops.has_init_immidiate())
-        else:
-            code = ""
+            code += DataBank().assemblyRandomizeRegisterFile(randomize_immediate=random_ops.has_init_immidiate())
         
         testCode, testInstructions, instructionCount = self._createInterleavingInstructions(level, immediateProbability,
                                                                                             switchProbability,
@@ -443,10 +559,9 @@ class Stack:
     def createSequenceInstructions(self, instructionList, random_ops, immediateProbability=0.0, switchProbability=0.0, forwarding=0,
                                    specialImmediates=0.0, forwardingStallProb=0.0):
         
+        code = AssemblyBuffer()
         if random_ops.has_init_reg_file():
-            code = DataBank().assemblyRandomizeRegisterFile(random_ops.has_init_immidiate())
-        else:
-            code = ""
+            code += DataBank().assemblyRandomizeRegisterFile(random_ops.has_init_immidiate())
         
         testCode, testInstructions, instructionCount = self._generateCodeSequence(instructionList, forwarding,
                                                                                   immediateProbability,
@@ -491,66 +606,21 @@ class Stack:
         return result, len(self._instructionsList), totalInstructions
         
 
-    def create_basic_instruction_test(self, random_ops: RandomOptions, singleInstruction: str = "") -> Dict[str, str]:
+    def create_basic_instruction_test(self, random_ops: RandomOptions, singleInstruction: str = "", shard: int = 0,
+                                      shards: int = 1, pack: int = 1) -> Dict[str, str]:
         """ Dont test special codes. Creates for each possible feature combination for each instruction (or specific ones) its own assembly test code. This method is for debugging purposes only.
 
         Args:
             singleInstruction (str, optional): If only specific instructions should be tested, the name of the instruction . Defaults to "".
+            shard (int, optional): Only create the combinations with index // pack % shards == shard. Defaults to 0.
+            shards (int, optional): Number of parts the combinations are split into. Defaults to 1.
+            pack (int, optional): Number of consecutive combinations, that are kept in the same part. Defaults to 1.
 
         Returns:
-            Dict[str, str]: The identifying name of each combination with its assembly code.
+            Dict[str, Tuple[int, str]]: The identifying name of each combination with its index and its assembly code.
         """
-        result = {}
-        self.generateInstructionsList(1, singleInstruction)
-        testInstructionCount = 0
-        totalInstructions = 0
-        # going through every instruction in xml list
-        for index in range(len(self._instructionsList)):
-            if True:
-                # if self._instructionsList[index].getInstruction() != NOP_INSTR:
-                # v equals features of currently choosen instruction
-                features = Processor().getAvailableInstructionFeaturesNames(
-                    self._instructionsList[index].getInstruction())
-                testInstruction: TestInstruction = self._instructionsList[index]
-                for immidiateAttr in features[IMMEDIATE]:
-                    testInstruction.setEnableFeatureName(IMMEDIATE, immidiateAttr)
-                    for alignedVal in features[ADDRESS_ALIGNMENT]:
-                        testInstruction.setEnableFeature(ADDRESS_ALIGNMENT, alignedVal)
-                        for conditionAttr in features[CONDITIONAL]:
-                            testInstruction.setEnableFeatureName(CONDITIONAL, conditionAttr)
-                            for flagCondSettings in Processor().getFeatureAttributes(CONDITIONAL_READ) or [None]:
-                                if conditionAttr == CONDITIONAL_READ:
-                                    testInstruction.setEnableFeature(CONDITIONAL_READ, flagCondSettings)
-                                for saturationAttr in features[SATURATION]:
-                                    testInstruction.setEnableFeatureName(SATURATION, saturationAttr)
-                                    for signageAttr in features[SIGNAGE]:
-                                        testInstruction.setEnableFeatureName(SIGNAGE, signageAttr)
-                                        for simdAttr in features[SIMD]:
-                                            testInstruction.setEnableFeatureName(SIMD, simdAttr)
-
-                                            # distinct enabled features naming string as key for code in dict
-                                            # idea: name equal to instruction name
-                                            enabledFeaturesString = ""
-                                            enabledFeaturesString += "_" + "I" + "-" + immidiateAttr if immidiateAttr else ""
-                                            enabledFeaturesString += "_" + "Addr" + "-" + alignedVal if alignedVal else ""
-                                            enabledFeaturesString += "_" + "Cond" + "-" + conditionAttr if conditionAttr else ""
-                                            enabledFeaturesString += "-" + flagCondSettings if flagCondSettings and conditionAttr == CONDITIONAL_READ else ""
-                                            enabledFeaturesString += "_" + "Sat" + "-" + saturationAttr if saturationAttr else ""
-                                            enabledFeaturesString += "_" + "Sig" + "-" + signageAttr if signageAttr else ""
-                                            enabledFeaturesString += "_" + SIMD + "-" + simdAttr if simdAttr else ""
-
-                                            key = testInstruction.getInstruction() + enabledFeaturesString
-                                            if key not in result:
-                                                assembly = self._generate_single_test_assembly(testInstruction, index, random_ops=random_ops)
-                                                
-                                                result[testInstruction.getInstruction() + enabledFeaturesString] = assembly
-                                                testInstructionCount += 1
-                                                totalInstructions += testInstruction.getInstructionCount()
-                                            
-                                            Processor().reset()
+        return self._createFeatureCombinationTests(random_ops, singleInstruction, False, shard, shards, pack)
 
-        return result, testInstructionCount, totalInstructions
-    
     def _set_restore_operands(self, testInstructionOperands, enabledFeatures):
         operands = Processor().generateRandomOperands(enabledFeatures, generateFocusRegister=False,
                                                       randImmediateExtension=DataBank().instance.randomImmediateType)
@@ -599,71 +669,115 @@ class Stack:
         
 
 
-    def create_complete_instruction_test(self, random_ops:RandomOptions, singleInstruction: str = "") -> Dict[str, str]:
+    def create_complete_instruction_test(self, random_ops:RandomOptions, singleInstruction: str = "", shard: int = 0,
+                                         shards: int = 1, pack: int = 1) -> Dict[str, str]:
         """Creates for each possible feature combination for each instruction (or specific ones) its own assembly test code. 
         Contains create_basic_instruction_test, additionally adds operand switchsing (i.e. random operand is now in operand 0 instead of only operand 1).
         Needed for forwarding tests of source operand 0.
 
         Args:
             singleInstruction (str, optional): If only specific instructions should be tested, the name of the instruction . Defaults to "".
+            shard (int, optional): Only create the combinations with index // pack % shards == shard. Defaults to 0.
+            shards (int, optional): Number of parts the combinations are split into. Defaults to 1.
+            pack (int, optional): Number of consecutive combinations, that are kept in the same part. Defaults to 1.
 
         Returns:
-            Dict[str, str]: The identifying name of each combination with its assembly code.
+            Dict[str, Tuple[int, str]]: The identifying name of each combination with its index and its assembly code.
         """
+        return self._createFeatureCombinationTests(random_ops, singleInstruction, True, shard, shards, pack)
+
+    def _createFeatureCombinationTests(self, random_ops: RandomOptions, singleInstruction: str, switch: bool,
+                                       shard: int, shards: int, pack: int = 1):
+        """Creates the tests of create_basic_instruction_test (switch False) and create_complete_instruction_test
+        (switch True, nop is not tested). The combinations are indexed in the order of the instruction xml, so the
+        index of a combination is the same in each shard. Blocks of pack consecutive indices are in the same shard."""
+        ownedCombinations = {}
+        for instruction, combinations in self._getFeatureCombinations(singleInstruction, switch).items():
+            owned = [combination for combination in combinations if combination[0] // pack % shards == shard]
+            if owned:
+                ownedCombinations[instruction] = owned
+
         result = {}
         self.generateInstructionsList(1, singleInstruction)
         testInstructionCount = 0
         totalInstructions = 0
         # going through every instruction in xml list
         for index in range(len(self._instructionsList)):
-            if self._instructionsList[index].getInstruction() != NOP_INSTR:
-                # v equals features of currently choosen instruction
-                features = Processor().getAvailableInstructionFeaturesNames(
-                    self._instructionsList[index].getInstruction())
-                testInstruction: TestInstruction = self._instructionsList[index]
-                for immidiateAttr in features[IMMEDIATE]:
-                    testInstruction.setEnableFeatureName(IMMEDIATE, immidiateAttr)
-                    for alignedVal in features[ADDRESS_ALIGNMENT]:
-                        testInstruction.setEnableFeature(ADDRESS_ALIGNMENT, alignedVal)
-                        for conditionAttr in features[CONDITIONAL]:
-                            testInstruction.setEnableFeatureName(CONDITIONAL, conditionAttr)
-                            for flagCondSettings in Processor().getFeatureAttributes(CONDITIONAL_READ) or [None]:
-                                if conditionAttr == CONDITIONAL_READ:
-                                    testInstruction.setEnableFeature(CONDITIONAL_READ, flagCondSettings)
-                                for saturationAttr in features[SATURATION]:
-                                    testInstruction.setEnableFeatureName(SATURATION, saturationAttr)
-                                    for signageAttr in features[SIGNAGE]:
-                                        testInstruction.setEnableFeatureName(SIGNAGE, signageAttr)
-                                        for simdAttr in features[SIMD]:
-                                            testInstruction.setEnableFeatureName(SIMD, simdAttr)
-                                            for switchAttr in features[SWITCH]:
-                                                if immidiateAttr:
-                                                    switchAttr = None
-                                                testInstruction.setEnableFeatureName(SWITCH, switchAttr)
-                                                
-                                                 # distinct enabled features naming string as key for code in dict
-                                                # idea: name equal to instruction name
-                                                enabledFeaturesString = ""
-                                                enabledFeaturesString += "_" + "I" + "-" + immidiateAttr if immidiateAttr else ""
-                                                enabledFeaturesString += "_" + "Addr" + "-" + alignedVal if alignedVal else ""
-                                                enabledFeaturesString += "_" + "Cond" + "-" + conditionAttr if conditionAttr else ""
-                                                enabledFeaturesString += "-" + flagCondSettings if flagCondSettings and conditionAttr == CONDITIONAL_READ else ""
-                                                enabledFeaturesString += "_" + "Sat" + "-" + saturationAttr if saturationAttr else ""
-                                                enabledFeaturesString += "_" + "Sig" + "-" + signageAttr if signageAttr else ""
-                                                enabledFeaturesString += "_" + SIMD + "-" + simdAttr if simdAttr else ""
-                                                enabledFeaturesString += "_" + "sw" + "-" + switchAttr if switchAttr else ""
-
-                                                key = testInstruction.getInstruction() + enabledFeaturesString
-                                                if key not in result:
-                                                    assembly = self._generate_single_test_assembly(testInstruction, index, random_ops)
-                                                    
-                                                    result[key] = assembly
-                                                    testInstructionCount += 1
-                                                    totalInstructions += testInstruction.getInstructionCount()
-                                                
-                                                Processor().reset()
+            testInstruction: TestInstruction = self._instructionsList[index]
+            if switch and testInstruction.getInstruction() == NOP_INSTR:
+                continue
+            for combinationIndex, key, enabledFeatures in ownedCombinations.get(testInstruction.getInstruction(), []):
+                if key in result:
+                    continue
+                for feature, attribute in enabledFeatures.items():
+                    testInstruction.setEnableFeature(feature, attribute)
+                assembly = self._generate_single_test_assembly(testInstruction, index, random_ops=random_ops)
+
+                result[key] = (combinationIndex, assembly)
+                testInstructionCount += 1
+                totalInstructions += testInstruction.getInstructionCount()
+
+                Processor().reset()
 
         return result, testInstructionCount, totalInstructions
 
+    def _getFeatureCombinations(self, singleInstruction: str, switch: bool) -> Dict[str, list]:
+        """Returns the distinct feature combinations of each instruction as (index, name, enabled features). They are
+        enumerated once per stack, so a shard only walks the combinations it owns."""
+        if (singleInstruction, switch) not in self._featureCombinations:
+            combinations = {}
+            keys = set()
+            for template in self._TestInstructions:
+                if singleInstruction != "" and template.getInstruction().upper() != singleInstruction.upper():
+                    continue
+                testInstruction = template.clone()
+                for key in self._enableFeatureCombinations(testInstruction, switch):
+                    if key not in keys:
+                        keys.add(key)
+                        combinations.setdefault(template.getInstruction(), []).append(
+                            (len(keys) - 1, key, dict(testInstruction.getEnabledFeatures())))
+            self._featureCombinations[(singleInstruction, switch)] = combinations
+        return self._featureCombinations[(singleInstruction, switch)]
+
+    def _enableFeatureCombinations(self, testInstruction: TestInstruction, switch: bool):
+        """Enables each feature combination of the instruction on testInstruction one after another and yields the
+        distinct name of the combination. If switch is True, the operand switching is combined, too."""
+        # v equals features of currently choosen instruction
+        features = Processor().getAvailableInstructionFeaturesNames(testInstruction.getInstruction())
+        for immidiateAttr in features[IMMEDIATE]:
+            testInstruction.setEnableFeatureName(IMMEDIATE, immidiateAttr)
+            for alignedVal in features[ADDRESS_ALIGNMENT]:
+                testInstruction.setEnableFeature(ADDRESS_ALIGNMENT, alignedVal)
+                for conditionAttr in features[CONDITIONAL]:
+                    testInstruction.setEnableFeatureName(CONDITIONAL, conditionAttr)
+                    for flagCondSettings in Processor().getFeatureAttributes(CONDITIONAL_READ) or [None]:
+                        if conditionAttr == CONDITIONAL_READ:
+                            testInstruction.setEnableFeature(CONDITIONAL_READ, flagCondSettings)
+                        for saturationAttr in features[SATURATION]:
+                            testInstruction.setEnableFeatureName(SATURATION, saturationAttr)
+                            for signageAttr in features[SIGNAGE]:
+                                testInstruction.setEnableFeatureName(SIGNAGE, signageAttr)
+                                for simdAttr in features[SIMD]:
+                                    testInstruction.setEnableFeatureName(SIMD, simdAttr)
+                                    for switchAttr in features[SWITCH] if switch else [None]:
+                                        if switch:
+                                            if immidiateAttr:
+                                                switchAttr = None
+                                            testInstruction.setEnableFeatureName(SWITCH, switchAttr)
+
+                                        # distinct enabled features naming string as key for code in dict
+                                        # idea: name equal to instruction name
+                                        enabledFeaturesString = ""
+                                        enabledFeaturesString += "_" + "I" + "-" + immidiateAttr if immidiateAttr else ""
+                                        enabledFeaturesString += "_" + "Addr" + "-" + alignedVal if alignedVal else ""
+                                        enabledFeaturesString += "_" + "Cond" + "-" + conditionAttr if conditionAttr else ""
+                                        enabledFeaturesString += "-" + flagCondSettings if flagCondSettings and conditionAttr == CONDITIONAL_READ else ""
+                                        enabledFeaturesString += "_" + "Sat" + "-" + saturationAttr if saturationAttr else ""
+                                        enabledFeaturesString += "_" + "Sig" + "-" + signageAttr if signageAttr else ""
+                                        enabledFeaturesString += "_" + SIMD + "-" + simdAttr if simdAttr else ""
+                                        enabledFeaturesString += "_" + "sw" + "-" + switchAttr if switchAttr else ""
+
+                                        yield testInstruction.getInstruction() + enabledFeaturesString
+
     def get_comment(self):
         return self.processor["comment"]
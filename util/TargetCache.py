@@ -0,0 +1,105 @@
+# Copyright (c) 2022 Chair for Chip Design for Embedded Computing,
+#                    Technische Universitaet Braunschweig, Germany
+#                    www.tu-braunschweig.de/en/eis
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT
+
+import glob
+import hashlib
+import os
+import pickle
+import tempfile
+import warnings
+
+from Constants import *
+import Constants
+
+
+class TargetCache:
+    """Persistent cache of processed targets on disk.
+
+    Entries are keyed on the content of processor_{TARGET}.xml and instructions_{TARGET}.xml, the enabled isa
+    extensions, the tool version and the source code of the generator. Changing any of them results in a new entry,
+    which replaces the old entries of the same target, name and isa extensions.
+    """
+    _sourceKey = None
+
+    def __init__(self, architecture, name, enabled_extensions=""):
+        self.architecture = architecture
+        self.name = name
+        self.enabled_extensions = enabled_extensions
+        extensionKey = hashlib.sha256(enabled_extensions.encode()).hexdigest()[:8]
+        self.prefix = os.path.join(os.path.expanduser(Constants.FOLDER_TARGET_CACHE),
+                                   architecture + "_" + name + "_" + extensionKey + "_")
+        self.path = self.prefix + self._calculateKey() + ".pickle"
+
+    @staticmethod
+    def _calculateSourceKey() -> str:
+        """returns the hash of Constants.py and util/*.py, which create the cached objects"""
+        if TargetCache._sourceKey is None:
+            root = os.path.dirname(os.path.abspath(Constants.__file__))
+            key = hashlib.sha256()
+            for path in [os.path.join(root, "Constants.py")] + sorted(glob.glob(os.path.join(root, "util", "*.py"))):
+                with open(path, 'rb') as file:
+                    key.update(file.read())
+            TargetCache._sourceKey = key.hexdigest()
+        return TargetCache._sourceKey
+
+    def _calculateKey(self) -> str:
+        key = hashlib.sha256()
+        for path in [get_path_processor(self.architecture), get_path_instruction(self.architecture)]:
+            with open(path, 'rb') as file:
+                key.update(file.read())
+        key.update(self.name.encode())
+        key.update(self.enabled_extensions.encode())
+        key.update(VERSION.encode())
+        key.update(str(TARGET_CACHE_FORMAT).encode())
+        key.update(self._calculateSourceKey().encode())
+        return key.hexdigest()
+
+    def isEnabled(self) -> bool:
+        return Constants.TARGET_CACHE_ENABLED
+
+    def load(self):
+        """returns the cached object or None, if the cache is disabled or has no valid entry"""
+        if not self.isEnabled() or not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as file:
+                return pickle.load(file)
+        except Exception as e:
+            warnings.warn(f"Ignoring invalid target cache entry {self.path}: {e}")
+            return None
+
+    def store(self, bundle):
+        """stores the bundle. The entry is written to a temporary file and renamed, so concurrent workers never read
+        a partially written entry."""
+        if not self.isEnabled():
+            return
+        directory = os.path.dirname(self.path)
+        tempPath = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tempPath = tempfile.mkstemp(dir=directory, suffix=".tmp")
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(bundle, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tempPath, self.path)
+        except Exception as e:
+            if tempPath and os.path.exists(tempPath):
+                os.remove(tempPath)
+            warnings.warn(f"Could not write target cache entry {self.path}: {e}")
+            return
+        self._removeStaleEntries()
+
+    def _removeStaleEntries(self):
+        """removes the entries of the same target, name and isa extensions with another key"""
+        for path in glob.glob(glob.escape(self.prefix) + "*.pickle"):
+            if path == self.path:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # already removed by a concurrent worker
+                pass
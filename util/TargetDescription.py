@@ -0,0 +1,132 @@
+# Copyright (c) 2022 Chair for Chip Design for Embedded Computing,
+#                    Technische Universitaet Braunschweig, Germany
+#                    www.tu-braunschweig.de/en/eis
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT
+
+from threading import Lock
+from typing import Union
+
+import xmltodict
+
+from Constants import *
+from util.TargetCache import TargetCache
+
+
+class TargetDescription:
+    class __TargetDescription:
+        def __init__(self, architecture):
+            self.architecture = architecture
+            cache = TargetCache(architecture, TARGET_CACHE_DESCRIPTION)
+            bundle = cache.load()
+            if bundle is None:
+                bundle = {PROCESSOR: self.fetch_xml_data(get_path_processor(architecture)),
+                          INST_LIST: self.fetch_xml_data(get_path_instruction(architecture))}
+                bundle[INSTRUCTION_FEATURES] = self._buildFeatureIndex(bundle[INST_LIST][INST_LIST])
+                cache.store(bundle)
+            self.processorXML = bundle[PROCESSOR]
+            self.instructionXML = bundle[INST_LIST]
+            self.featureIndex = bundle[INSTRUCTION_FEATURES]
+
+        def _buildFeatureIndex(self, instructionXML) -> dict:
+            featureIndex = {}
+            for instruction in instructionXML:
+                # the default modes have the features of an instruction definition
+                if self.isInstruction(instruction) or instruction == INSTRUCTION_DEFAULT_MODES:
+                    featureIndex[instruction] = self.parseFeatureNames(instructionXML[instruction])
+            return featureIndex
+
+        def isInstruction(self, key) -> bool:
+            """returns False for the special entries of the instruction xml which are no instruction definitions"""
+            if key == COMPARISON:
+                return False
+            if key == INSTRUCTION_DEFAULT_MODES:
+                return False
+            if key == INIT:
+                return False
+            if key == POST_INIT:
+                return False
+            if key == IMMEDIATE_ASSEMBLY:
+                return False
+            if key == CONDITIONAL_READ:
+                return False
+            if key == END_SIMULATION:
+                return False
+            if key == GLOBAL_PRE_SEQUENCE:
+                return False
+            if key == FIX_IMM_VALUE:
+                return False
+            if key == PRE_REVERSE_PROCESSOR_STATE:
+                return False
+            if key == PRE_REVERSE_POST_REG_INIT_PROCESSOR_STATE:
+                return False
+            if key == POST_REVERSE_PROCESSOR_STATE:
+                return False
+
+            return True
+
+        def parseFeatureNames(self, inst) -> dict:
+            """returns each feature of the instruction definition with a tuple of its allowed attribute names"""
+            attrDict = {}
+            for feature in INSTRUCTION_FEATURE_LIST + INSTRUCTION_SPECIAL_FEATURE:
+                if feature in inst and inst[feature] is not None:
+                    attributes = inst[feature].split(DELIMITER_FEATURE)
+                else:
+                    attributes = [None]
+                # change empty string to None
+                attrDict[feature] = tuple(None if value == '' or value == NONE_CONSTANT else value
+                                          for value in attributes)
+            return attrDict
+
+        def fetch_xml_data(self, path: str):
+            file = open(path)
+            xml_content = xmltodict.parse(file.read())
+            file.close()
+            return xml_content
+
+    # parsed targets are shared by Processor, DataBank and ConditionalExecutionCode of all processes forked after
+    # loading. The parsed xml content is read only, never modify it!
+    _instances = {}
+    instance = None
+    _lock = Lock()
+
+    def __init__(self, architecture="rv32imc"):
+        with self._lock:
+            if architecture not in self._instances:
+                TargetDescription._instances[architecture] = TargetDescription.__TargetDescription(architecture)
+            self.instance = TargetDescription._instances[architecture]
+
+    def getArchitecture(self) -> str:
+        return self.instance.architecture
+
+    def getProcessorInfos(self) -> dict:
+        """returns the parsed content of processor_{TARGET}.xml"""
+        return self.instance.processorXML[PROCESSOR]
+
+    def getInstructionXML(self) -> dict:
+        """returns the parsed content of instructions_{TARGET}.xml"""
+        return self.instance.instructionXML[INST_LIST]
+
+    def isInstruction(self, key: str) -> bool:
+        """returns if the entry key of the instruction xml is an instruction definition"""
+        return self.instance.isInstruction(key)
+
+    def getFeatureNames(self, instruction: str) -> Union[dict, None]:
+        """returns the features of the instruction with a tuple of the allowed attribute names for each feature.
+        The returned dict is shared, do not modify it.
+
+        Args:
+            instruction (str): lower case name of the instruction in the instruction xml
+
+        Returns:
+            Union[dict, None]: features with allowed attributes or None if the instruction is not defined
+        """
+        featureIndex = self.instance.featureIndex
+        if instruction not in featureIndex:
+            instructionXML = self.getInstructionXML()
+            if instruction not in instructionXML:
+                return None
+            featureIndex[instruction] = self.instance.parseFeatureNames(instructionXML[instruction])
+        return featureIndex[instruction]
@@ -7,6 +7,7 @@
 # https://opensource.org/licenses/MIT
 
 
+import copy
 from typing import List, Dict
 
 from Constants import *
@@ -59,9 +60,94 @@ class TestInstruction:
             self.iCacheRepetition.append(Instruction(instr, instruction_set))
         self._enabledFeatures = {}
         self.type = type
+        self.outsideSequenceUsage = False
+        self.template = None  # test instruction of the DataBank this instruction was cloned from
         
         
 
+    def clone(self, immediateReverseAssembly=None):
+        """
+        Replaces copy.deepcopy of a test instruction. The immutable parts (instruction set, special immediates, parsed
+        instruction templates) are shared with the original, the instructions and the state changed during code
+        generation are copied.
+        :param immediateReverseAssembly: copied immediate assembly of the parent, specializations share it with the
+        parent test instruction
+        :return: the copied test instruction
+        """
+        testInstruction = copy.copy(self)
+        testInstruction.template = self.getTemplate()
+        if immediateReverseAssembly is None and self.immediateReverseAssembly:
+            immediateReverseAssembly = {}
+            for imm in self.immediateReverseAssembly:
+                immediateReverseAssembly[imm] = {}
+                for simd in self.immediateReverseAssembly[imm]:
+                    immediateReverseAssembly[imm][simd] = [instr.clone() for instr in
+                                                           self.immediateReverseAssembly[imm][simd]]
+        elif immediateReverseAssembly is None:
+            immediateReverseAssembly = self.immediateReverseAssembly
+        testInstruction.immediateReverseAssembly = immediateReverseAssembly
+
+        testInstruction._modInstructions = [instr.clone() for instr in self._modInstructions]
+        testInstruction._sequenceInstructions = [instr.clone() for instr in self._sequenceInstructions]
+        testInstruction._preSequenceInstructions = [instr.clone() for instr in self._preSequenceInstructions]
+        testInstruction._postPlainInstructions = [instr.clone() for instr in self._postPlainInstructions]
+        testInstruction.iCacheRepetition = [instr.clone() for instr in self.iCacheRepetition]
+        testInstruction._reverseInstructions = {}
+        for simd in self._reverseInstructions:
+            testInstruction._reverseInstructions[simd] = [instr.clone() for instr in self._reverseInstructions[simd]]
+        testInstruction.specialization = {}
+        for category in self.specialization:
+            testInstruction.specialization[category] = {}
+            for featureName in self.specialization[category]:
+                testInstruction.specialization[category][featureName] = \
+                    self.specialization[category][featureName].clone(immediateReverseAssembly)
+
+        testInstruction.operandAttributes = dict(self.operandAttributes)
+        testInstruction.globalMandatoryFeatures = dict(self.globalMandatoryFeatures)
+        testInstruction._enabledFeatures = dict(self._enabledFeatures)
+        return testInstruction
+
+    def getTemplate(self):
+        return self if self.template is None else self.template
+
+    def getGenerationState(self) -> tuple:
+        """
+        State of the test instruction set during the generation of a test. Together with the template it describes
+        the test instruction, see restoreGenerationState.
+        :return: tuple of plain values (features, operands, counters)
+        """
+        return (self._enabledFeatures, self.operandAttributes, self.interleavingTargetRegister,
+                self.globalMandatoryFeatures, self.iCacheJump, self.outsideSequenceUsage, self.getInstructionCount())
+
+    def restoreGenerationState(self, state: tuple):
+        """
+        Creates a copy of this template with the state of getGenerationState.
+        :param state: state of a test instruction cloned from this template
+        :return: the restored test instruction
+        """
+        testInstruction = self.clone()
+        enabledFeatures, operands, targetRegister, globalMandatoryFeatures, iCacheJump, outsideSequenceUsage, \
+            instructionCount = state
+        testInstruction._enabledFeatures = enabledFeatures
+        testInstruction.globalMandatoryFeatures = globalMandatoryFeatures
+        testInstruction.iCacheJump = iCacheJump
+        testInstruction.isOutsideSequenceUsed(outsideSequenceUsage)
+        testInstruction.interleavingTargetRegister = targetRegister
+        if operands:
+            testInstruction._setOperationRegister(operands)
+            testInstruction._setOperandsReversi()
+        if instructionCount:
+            testInstruction._setInstructionCount(instructionCount)
+        return testInstruction
+
+    def randomizeIssueSlot(self):
+        """Draws a new random issue slot for this test instruction and its specializations, in the same order as
+        during construction."""
+        self.globalMandatoryFeatures[ISSUE_SLOT] = Processor().getRandomIssueSlot()
+        for category in self.specialization:
+            for featureName in self.specialization[category]:
+                self.specialization[category][featureName].randomizeIssueSlot()
+
     def _checkNewPlainTargetReg(self):
         self.newSequenceTargetReg = False
         for instr in self._sequenceInstructions:
@@ -631,6 +717,7 @@ class TestInstruction:
     def isOutsideSequenceUsed(self, outsideSequenceUsage):
         # if icacheMiss is triggered Outside of a sequence, registers from seqeunces get used
         # outside of seqeunces these registers are not protected, thus change plaintemp to t2
+        self.outsideSequenceUsage = outsideSequenceUsage
         if outsideSequenceUsage and self.iCacheJump:
             # overwrite pre seqeuence code
             if self._enabledFeaturesUseSpecialization():
@@ -824,6 +911,14 @@ class TestInstruction:
             specializedTestInstruction: TestInstruction = self._getSpecializationTestInstruction()
             specializedTestInstruction._resetInstructionCount()
 
+    def _setInstructionCount(self, instructionCount):
+        self.instructionCount = instructionCount
+        if self._enabledFeaturesUseSpecialization():
+            specializedTestInstruction: TestInstruction = self._getSpecializationTestInstruction()
+            # the specialization shares the enabled features (see copyEnabledFeatures)
+            specializedTestInstruction._enabledFeatures = self._enabledFeatures
+            specializedTestInstruction._setInstructionCount(instructionCount)
+
     def _isReadConditionEnabled(self):
         if CONDITIONAL in self._enabledFeatures:
             return CONDITIONAL_READ == self._enabledFeatures[CONDITIONAL]
@@ -0,0 +1,289 @@
+# Copyright (c) 2022 Chair for Chip Design for Embedded Computing,
+#                    Technische Universitaet Braunschweig, Germany
+#                    www.tu-braunschweig.de/en/eis
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT
+
+import mmap
+import os
+import struct
+import tempfile
+from array import array
+
+import Constants
+from util.Immediate import Immediate
+
+# A record is the header followed by the interleaving target register and the values of the enabled features,
+# operands and global mandatory features in the order of the keys of their shapes. Each value is a tag byte followed
+# by its payload: nothing for None and booleans, a 64 bit integer, or a string as 16 bit length and utf-8 bytes.
+# An immediate is its operand string followed by its tagged integer value.
+_HEADER = struct.Struct("<IBIIII")  # template, flags, instruction count, shapes of the three dicts
+_INTEGER = struct.Struct("<q")
+_LENGTH = struct.Struct("<H")
+_NONE, _FALSE, _TRUE, _INT, _LARGE_INT, _STRING, _IMMEDIATE = range(7)
+_ICACHE_JUMP = 1
+_OUTSIDE_SEQUENCE_USAGE = 2
+
+
+class TestInstructionLog:
+    """List of test instructions for very long interleaving tests.
+
+    Instead of the test instruction objects only their template and generation state are stored as binary records.
+    The keys of the state dicts are stored once per distinct key tuple (shape), the records only hold the values.
+    The records are kept in memory up to BOUNDED_MEMORY_SPILL_SIZE bytes, then they are moved to a temporary file
+    which is read through a memory map. Reading an element restores a test instruction from its template, changes to
+    it have to be written back (log[index] = testInstruction). Unchanged records are not written, a changed record
+    replaces the old record if it fits into its slot and is moved to a new slot at the end otherwise. Records grow
+    while their operands are generated, so slots are allocated with the largest record size seen for their template.
+    """
+
+    def __init__(self):
+        self._templates = []
+        self._templateIndices = {}
+        self._recordSizes = []
+        self._shapes = []
+        self._shapeIndices = {}
+        self._offsets = array('Q')
+        self._lengths = array('I')
+        self._capacities = array('I')
+        self._data = bytearray()
+        self._file = None
+        self._map = None
+        self._size = 0
+        self._garbage = 0
+
+    def _encode(self, testInstruction):
+        """returns the record of testInstruction and the slot size for it"""
+        template = testInstruction.getTemplate()
+        if id(template) not in self._templateIndices:
+            self._templateIndices[id(template)] = len(self._templates)
+            self._templates.append(template)
+            self._recordSizes.append(0)
+        templateIndex = self._templateIndices[id(template)]
+        enabledFeatures, operands, targetRegister, globalMandatoryFeatures, iCacheJump, outsideSequenceUsage, \
+            instructionCount = testInstruction.getGenerationState()
+        flags = (_ICACHE_JUMP if iCacheJump else 0) | (_OUTSIDE_SEQUENCE_USAGE if outsideSequenceUsage else 0)
+        record = bytearray(_HEADER.pack(templateIndex, flags, instructionCount, self._getShape(enabledFeatures),
+                                        self._getShape(operands), self._getShape(globalMandatoryFeatures)))
+        self._encodeValue(record, targetRegister)
+        for values in (enabledFeatures, operands, globalMandatoryFeatures):
+            for value in values.values():
+                self._encodeValue(record, value)
+        record = bytes(record)
+        self._recordSizes[templateIndex] = max(self._recordSizes[templateIndex], len(record))
+        return record, self._recordSizes[templateIndex]
+
+    def _getShape(self, values: dict) -> int:
+        shape = tuple(values)
+        if shape not in self._shapeIndices:
+            self._shapeIndices[shape] = len(self._shapes)
+            self._shapes.append(shape)
+        return self._shapeIndices[shape]
+
+    def _encodeValue(self, record: bytearray, value):
+        if value is None:
+            record.append(_NONE)
+        elif value is False or value is True:
+            record.append(_TRUE if value else _FALSE)
+        elif isinstance(value, Immediate):
+            record.append(_IMMEDIATE)
+            self._encodeString(record, str(value))
+            self._encodeValue(record, value.value)
+        elif isinstance(value, str):
+            record.append(_STRING)
+            self._encodeString(record, value)
+        elif isinstance(value, int):
+            if -2 ** 63 <= value < 2 ** 63:
+                record.append(_INT)
+                record += _INTEGER.pack(value)
+            else:
+                record.append(_LARGE_INT)
+                self._encodeString(record, str(value))
+        else:
+            raise TypeError(f"ERROR: {type(value).__name__} values can not be stored in a TestInstructionLog")
+
+    def _encodeString(self, record: bytearray, value: str):
+        encoded = value.encode()
+        record += _LENGTH.pack(len(encoded))
+        record += encoded
+
+    def _decodeValue(self, record: bytes, offset: int):
+        """returns the value at offset and the offset after it"""
+        tag = record[offset]
+        offset += 1
+        if tag == _NONE:
+            return None, offset
+        if tag == _FALSE or tag == _TRUE:
+            return tag == _TRUE, offset
+        if tag == _INT:
+            return _INTEGER.unpack_from(record, offset)[0], offset + _INTEGER.size
+        string, offset = self._decodeString(record, offset)
+        if tag == _STRING:
+            return string, offset
+        if tag == _LARGE_INT:
+            return int(string), offset
+        value, offset = self._decodeValue(record, offset)
+        return Immediate(string, value), offset
+
+    def _decodeString(self, record: bytes, offset: int):
+        length, = _LENGTH.unpack_from(record, offset)
+        offset += _LENGTH.size
+        return str(record[offset:offset + length], "utf-8"), offset + length
+
+    def _store(self, record: bytes, capacity):
+        """appends a slot of capacity bytes holding record, returns its offset"""
+        offset = self._size
+        record = record.ljust(capacity, b'\0')
+        if self._file is None:
+            self._data += record
+            if len(self._data) > Constants.BOUNDED_MEMORY_SPILL_SIZE:
+                self._file = tempfile.TemporaryFile()
+                self._file.write(self._data)
+                self._data = bytearray()
+        else:
+            self._file.write(record)
+        self._size += capacity
+        return offset
+
+    def _overwrite(self, offset, record: bytes):
+        """writes record over the stored bytes at offset"""
+        if self._file is None:
+            self._data[offset:offset + len(record)] = record
+        else:
+            # appended records might still be buffered
+            self._file.flush()
+            os.pwrite(self._file.fileno(), record, offset)
+
+    def _compact(self):
+        """moves all records into new slots of a new storage to free the slots of replaced records"""
+        if self._file is None:
+            source = self._data
+        else:
+            self._file.flush()
+            source = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        # the mapped records stay readable after closing the file
+        self.close()
+        offsets = self._offsets
+        self._offsets = array('Q')
+        self._data = bytearray()
+        self._size = 0
+        self._garbage = 0
+        for offset, length, capacity in zip(offsets, self._lengths, self._capacities):
+            self._offsets.append(self._store(source[offset:offset + length], capacity))
+        if isinstance(source, mmap.mmap):
+            source.close()
+
+    def _read(self, position) -> bytes:
+        offset = self._offsets[position]
+        end = offset + self._lengths[position]
+        if self._file is None:
+            return self._data[offset:end]
+        if self._map is None or len(self._map) < end:
+            self._file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:end]
+
+    def _load(self, position):
+        record = self._read(position)
+        templateIndex, flags, instructionCount, *shapes = _HEADER.unpack_from(record)
+        targetRegister, offset = self._decodeValue(record, _HEADER.size)
+        state = []
+        for shape in shapes:
+            values = {}
+            for key in self._shapes[shape]:
+                values[key], offset = self._decodeValue(record, offset)
+            state.append(values)
+        enabledFeatures, operands, globalMandatoryFeatures = state
+        return self._templates[templateIndex].restoreGenerationState(
+            (enabledFeatures, operands, targetRegister, globalMandatoryFeatures, bool(flags & _ICACHE_JUMP),
+             bool(flags & _OUTSIDE_SEQUENCE_USAGE), instructionCount))
+
+    def append(self, testInstruction):
+        record, capacity = self._encode(testInstruction)
+        self._offsets.append(self._store(record, capacity))
+        self._lengths.append(len(record))
+        self._capacities.append(capacity)
+
+    def insert(self, index, testInstruction):
+        record, capacity = self._encode(testInstruction)
+        self._offsets.insert(index, self._store(record, capacity))
+        self._lengths.insert(index, len(record))
+        self._capacities.insert(index, capacity)
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TestInstructionLogView(self, range(len(self))[index])
+        return self._load(range(len(self))[index])
+
+    def __setitem__(self, index, testInstruction):
+        position = range(len(self))[index]
+        record, capacity = self._encode(testInstruction)
+        if len(record) == self._lengths[position] and record == self._read(position):
+            # unchanged
+            return
+        if len(record) <= self._capacities[position]:
+            self._overwrite(self._offsets[position], record)
+        else:
+            self._garbage += self._capacities[position]
+            self._offsets[position] = self._store(record, capacity)
+            self._capacities[position] = capacity
+        self._lengths[position] = len(record)
+        if self._garbage > self._size // 2:
+            self._compact()
+
+    def __delitem__(self, index):
+        capacities = self._capacities[index]
+        self._garbage += sum(capacities) if isinstance(index, slice) else capacities
+        del self._offsets[index]
+        del self._lengths[index]
+        del self._capacities[index]
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._load(position)
+
+    def __reversed__(self):
+        for position in reversed(range(len(self))):
+            yield self._load(position)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class TestInstructionLogView:
+    """Slice of a TestInstructionLog, elements are read from and written back to the log."""
+
+    def __init__(self, log: TestInstructionLog, positions: range):
+        self._log = log
+        self._positions = positions
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return TestInstructionLogView(self._log, self._positions[index])
+        return self._log[self._positions[index]]
+
+    def __setitem__(self, index, testInstruction):
+        self._log[self._positions[index]] = testInstruction
+
+    def __iter__(self):
+        for position in self._positions:
+            yield self._log[position]
+
+    def __reversed__(self):
+        for position in reversed(self._positions):
+            yield self._log[position]
@@ -0,0 +1,111 @@
+# Copyright (c) 2022 Chair for Chip Design for Embedded Computing,
+#                    Technische Universitaet Braunschweig, Germany
+#                    www.tu-braunschweig.de/en/eis
+#
+# Use of this source code is governed by an MIT-style
+# license that can be found in the LICENSE file or at
+# https://opensource.org/licenses/MIT
+
+import io
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+
+import Constants
+from Constants import OUTPUT_ARCHIVE_PREFIX, OUTPUT_DIRECTORY
+from util.AssemblyBuffer import AssemblyBuffer
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class TestWriter:
+    """Writes the generated tests.
+
+    In the directory format each test is a file in the export directory. In the archive formats (tar, tar.zst, zip)
+    the tests of a process are streamed into one archive, so each worker writes its own archive and the export
+    directory only gets a few files. The archive is opened with the first test and named by the run ID and the
+    process ID. Next to each archive an index (archive.index) lists each test with the offset and size of its data in
+    the uncompressed tar stream or, for zip, the offset of its local header.
+    """
+
+    def __init__(self, directory: str, outputFormat=OUTPUT_DIRECTORY, runID=""):
+        if outputFormat == "tar.zst" and zstandard is None:
+            raise Exception("ERROR: tar.zst output needs the zstandard module (pip3 install zstandard)")
+        self.directory = directory
+        self.outputFormat = outputFormat
+        self.runID = runID
+        self.path = None  # path of the archive
+        self._archive = None
+        self._stream = None  # compressed stream of tar.zst
+        self._index = []
+
+    def write(self, filename: str, *parts):
+        """writes a test, the parts are strings or AssemblyBuffers"""
+        if self.outputFormat == OUTPUT_DIRECTORY:
+            with open(os.path.join(self.directory, filename), 'w') as file:
+                self._writeParts(file, parts)
+            return
+
+        if self._archive is None:
+            self._open()
+        if self.outputFormat == "zip":
+            # zip entries are streamed, their size does not have to be known
+            with io.TextIOWrapper(self._archive.open(filename, 'w', force_zip64=True), encoding="utf-8") as file:
+                self._writeParts(file, parts)
+            info = self._archive.infolist()[-1]
+            self._index.append((filename, info.header_offset, info.file_size))
+            return
+
+        # tar headers contain the size, so the test is written to a (spooled) temporary file first
+        with tempfile.SpooledTemporaryFile(max_size=Constants.BOUNDED_MEMORY_SPILL_SIZE) as data:
+            file = io.TextIOWrapper(data, encoding="utf-8")
+            self._writeParts(file, parts)
+            file.flush()
+            file.detach()
+            info = tarfile.TarInfo(filename)
+            info.size = data.tell()
+            info.mtime = int(time.time())
+            data.seek(0)
+            self._archive.addfile(info, data)
+        blocks = -(-info.size // tarfile.BLOCKSIZE)
+        self._index.append((filename, self._archive.offset - blocks * tarfile.BLOCKSIZE, info.size))
+
+    def _writeParts(self, file, parts):
+        for part in parts:
+            if isinstance(part, AssemblyBuffer):
+                part.writeTo(file)
+            else:
+                file.write(part)
+
+    def _open(self):
+        name = OUTPUT_ARCHIVE_PREFIX
+        if self.runID:
+            name += "_" + self.runID
+        name += "_" + str(os.getpid()) + "." + self.outputFormat
+        self.path = os.path.join(self.directory, name)
+        if self.outputFormat == "zip":
+            self._archive = zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED)
+        elif self.outputFormat == "tar.zst":
+            self._stream = zstandard.ZstdCompressor().stream_writer(open(self.path, 'wb'))
+            self._archive = tarfile.open(fileobj=self._stream, mode='w|')
+        else:
+            self._archive = tarfile.open(self.path, 'w')
+
+    def close(self):
+        """finishes the archive and writes its index"""
+        if self._archive is None:
+            return
+        self._archive.close()
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        self._archive = None
+        with open(self.path + ".index", 'w') as indexFile:
+            for filename, offset, size in self._index:
+                indexFile.write(f"{filename}\t{offset}\t{size}\n")
+        self._index = []